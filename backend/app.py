@@ -1,8 +1,14 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, has_request_context
 from flask_pymongo import PyMongo
+from pymongo import InsertOne, UpdateOne, DeleteOne, ReturnDocument
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 from flask_cors import CORS
 from datetime import datetime
+import hashlib
+import json
+import threading
+import time
 import uuid
 import requests
 app = Flask(__name__)
@@ -13,6 +19,285 @@ CORS(app)
 # Base URL for the meal planning service
 MEAL_PLANNING_BASE_URL = "http://localhost:8000"
 
+# Upstream timeouts (connect, read) in seconds; reads are long because of LLM calls
+UPSTREAM_TIMEOUT = (3, 90)
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT_SECONDS = 30
+# Time budget for a whole request (capped by the client's X-Deadline-Ms); the
+# remainder, less a margin for the response to travel back, goes upstream
+REQUEST_DEADLINE_SECONDS = UPSTREAM_TIMEOUT[1]
+DEADLINE_MARGIN_SECONDS = 1.0
+
+@app.before_request
+def start_request_deadline():
+    budget = REQUEST_DEADLINE_SECONDS
+    header = request.headers.get("X-Deadline-Ms")
+    if header:
+        try:
+            budget = min(budget, float(header) / 1000.0)
+        except ValueError:
+            pass
+    g.deadline = time.monotonic() + budget
+
+def remaining_budget():
+    """Seconds left in the current request's budget, or None outside a request"""
+    if not has_request_context() or getattr(g, "deadline", None) is None:
+        return None
+    return max(0.0, g.deadline - time.monotonic())
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} is unavailable, retry in {retry_after}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker. After CIRCUIT_FAILURE_THRESHOLD consecutive
+    failures the circuit opens and calls fail fast; once the reset timeout has
+    passed a single half-open probe is let through, which closes the circuit
+    on success or re-opens it on failure.
+    """
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def check(self):
+        """Raise CircuitOpenError if a call now would be refused, without claiming the probe"""
+        with self.lock:
+            if self.state == "closed":
+                return
+            elapsed = time.time() - self.opened_at
+            if elapsed >= self.reset_timeout and not self.probe_in_flight:
+                return
+            retry_after = max(1, int(self.reset_timeout - elapsed))
+        raise CircuitOpenError(self.name, retry_after)
+
+    def before_call(self):
+        with self.lock:
+            if self.state == "closed":
+                return
+            elapsed = time.time() - self.opened_at
+            if self.state == "open" and elapsed >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return
+            retry_after = max(1, int(self.reset_timeout - elapsed))
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def release_probe(self):
+        """Give up the half-open probe without an outcome, so another call can probe"""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+
+circuit_breakers = {}
+circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(url):
+    """Return the breaker for the upstream (scheme://host:port) serving url"""
+    upstream = "/".join(url.split("/")[:3])
+    with circuit_breakers_lock:
+        if upstream not in circuit_breakers:
+            circuit_breakers[upstream] = CircuitBreaker(upstream)
+        return circuit_breakers[upstream]
+
+def upstream_request(method, url, **kwargs):
+    """
+    Call an upstream service through its circuit breaker with a bounded timeout.
+    Connection errors, 5xx and 429 count as failures; other 4xx answers mean
+    the upstream is healthy and rejected the request, so they count as success.
+    """
+    breaker = get_circuit_breaker(url)
+    breaker.before_call()
+    budget = remaining_budget()
+    if budget is None:
+        kwargs.setdefault("timeout", UPSTREAM_TIMEOUT)
+    else:
+        # Tell the upstream how long it has, so it can degrade instead of being cut off
+        headers = dict(kwargs.get("headers") or {})
+        headers["X-Deadline-Ms"] = str(int(max(0.0, budget - DEADLINE_MARGIN_SECONDS) * 1000))
+        kwargs["headers"] = headers
+        kwargs.setdefault("timeout", (UPSTREAM_TIMEOUT[0], max(budget, 0.1)))
+    recorded = False
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        recorded = True
+        raise
+    else:
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        recorded = True
+    finally:
+        if not recorded:
+            breaker.release_probe()
+    return response
+
+def circuit_open_response(error):
+    """Fast 503 returned while an upstream circuit is open"""
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+# In-process snapshot of the Foods collection, already shaped for the meal
+# planning service. Invalidated by this app's write routes and, when the
+# cluster supports it, by a Mongo change stream.
+INVENTORY_CACHE_TTL_SECONDS = 300
+inventory_cache = {"inventory": None, "version": None, "built_at": 0.0, "generation": 0}
+inventory_cache_lock = threading.Lock()
+change_stream_state = {"started": False, "active": False}
+
+def format_inventory_item(food):
+    """Format a food document into the inventory item structure the planner expects"""
+    inventory_item = {
+        "item_name": food.get('name', 'Unknown'),
+        "quantity": food.get('quantity', 0),
+        "unit": food.get('unit', 'g'),
+        "expiry_date": None
+    }
+    
+    # Convert expiry date if available
+    if 'expiryDate' in food and food['expiryDate']:
+        if isinstance(food['expiryDate'], datetime):
+            inventory_item["expiry_date"] = food['expiryDate'].strftime('%Y-%m-%d')
+        elif isinstance(food['expiryDate'], str):
+            inventory_item["expiry_date"] = food['expiryDate'].split('T')[0]  # Format ISO date
+    
+    return inventory_item
+
+def invalidate_inventory_cache():
+    """Drop the cached inventory snapshot so the next planner call rebuilds it"""
+    with inventory_cache_lock:
+        inventory_cache["inventory"] = None
+        inventory_cache["version"] = None
+        inventory_cache["generation"] += 1
+
+def watch_inventory_changes():
+    """Invalidate the inventory cache on every change to the Foods collection"""
+    try:
+        with mongo.db.Foods.watch() as stream:
+            change_stream_state["active"] = True
+            for _ in stream:
+                invalidate_inventory_cache()
+    except Exception as e:
+        # Standalone servers do not support change streams; rely on write routes + TTL
+        print(f"Inventory change stream unavailable: {e}")
+    finally:
+        change_stream_state["active"] = False
+        invalidate_inventory_cache()
+
+def start_inventory_change_stream():
+    """Start the change stream watcher once, in a daemon thread"""
+    with inventory_cache_lock:
+        if change_stream_state["started"]:
+            return
+        change_stream_state["started"] = True
+    threading.Thread(target=watch_inventory_changes, daemon=True).start()
+
+def get_inventory_snapshot():
+    """
+    Return (inventory, version) from the cache, scanning the
+    Foods collection only when the snapshot is missing or older than the TTL
+    """
+    start_inventory_change_stream()
+    
+    with inventory_cache_lock:
+        fresh = time.time() - inventory_cache["built_at"] < INVENTORY_CACHE_TTL_SECONDS
+        if inventory_cache["inventory"] is not None and fresh:
+            return inventory_cache["inventory"], inventory_cache["version"]
+        generation = inventory_cache["generation"]
+    
+    inventory = [format_inventory_item(food) for food in mongo.db.Foods.find()]
+    version = hashlib.sha256(json.dumps(inventory).encode()).hexdigest()[:16]
+    
+    with inventory_cache_lock:
+        # Only publish the snapshot if no write invalidated it while we were scanning
+        if inventory_cache["generation"] == generation:
+            inventory_cache["inventory"] = inventory
+            inventory_cache["version"] = version
+            inventory_cache["built_at"] = time.time()
+    
+    return inventory, version
+
+# Last inventory version the meal planning service acknowledged, so later calls
+# can send just the version or a delta instead of the whole inventory
+upstream_inventory = {"version": None, "inventory": None}
+upstream_inventory_lock = threading.Lock()
+
+def inventory_delta(old_inventory, new_inventory):
+    """Diff two inventories by item name, or return None if names are not unique"""
+    old_items = {item["item_name"].lower(): item for item in old_inventory}
+    new_items = {item["item_name"].lower(): item for item in new_inventory}
+    if len(old_items) != len(old_inventory) or len(new_items) != len(new_inventory):
+        return None
+    
+    return {
+        "upserted": [item for key, item in new_items.items() if old_items.get(key) != item],
+        "removed": [old_items[key]["item_name"] for key in old_items if key not in new_items]
+    }
+
+def post_with_inventory(url, fields):
+    """
+    POST fields plus the current inventory to the meal planning service, sending
+    only the version (or a delta) when the service already holds a recent one.
+    Falls back to the full payload if the service answers 409 (unknown version).
+    """
+    # Fail fast before scanning the inventory if the upstream's circuit is open
+    get_circuit_breaker(url).check()
+    inventory, version = get_inventory_snapshot()
+    with upstream_inventory_lock:
+        known_version = upstream_inventory["version"]
+        known_inventory = upstream_inventory["inventory"]
+    
+    body = dict(fields, inventory_version=version)
+    delta = None
+    if known_version and known_version != version:
+        delta = inventory_delta(known_inventory, inventory)
+    
+    headers = {"Content-Type": "application/json"}
+    response = None
+    if known_version == version:
+        response = upstream_request("post", url, data=json.dumps(body), headers=headers)
+    elif delta is not None:
+        body.update(base_version=known_version, inventory_delta=delta)
+        response = upstream_request("post", url, data=json.dumps(body), headers=headers)
+    
+    if response is None or response.status_code == 409:
+        body = dict(fields, inventory_version=version, inventory=inventory)
+        response = upstream_request("post", url, data=json.dumps(body), headers=headers)
+    
+    if response.status_code == 200:
+        with upstream_inventory_lock:
+            upstream_inventory["version"] = version
+            upstream_inventory["inventory"] = inventory
+    return response
+
 @app.route('/api/v1/smart_meal_planner', methods=['POST'])
 def smart_meal_planner():
     """
@@ -26,42 +311,19 @@ def smart_meal_planner():
     
     dietary_preferences = data['dietary_preferences']
     
-    # Get inventory from the database
-    foods = mongo.db.Foods.find()
-    inventory = []
-    
-    for food in foods:
-        # Format inventory items to match the expected structure
-        inventory_item = {
-            "item_name": food.get('name', 'Unknown'),
-            "quantity": food.get('quantity', 0),
-            "unit": food.get('unit', 'g'),
-            "expiry_date": None
-        }
-        
-        # Convert expiry date if available
-        if 'expiryDate' in food and food['expiryDate']:
-            if isinstance(food['expiryDate'], datetime):
-                inventory_item["expiry_date"] = food['expiryDate'].strftime('%Y-%m-%d')
-            elif isinstance(food['expiryDate'], str):
-                inventory_item["expiry_date"] = food['expiryDate'].split('T')[0]  # Format ISO date
-        
-        inventory.append(inventory_item)
-    
-    # Prepare payload for the meal planning service
-    payload = {
-        "dietary_preferences": dietary_preferences,
-        "inventory": inventory
-    }
-    
-    # Make request to meal planning service
+    # Make request to meal planning service with the cached, versioned inventory
     try:
-        response = requests.post(f"{MEAL_PLANNING_BASE_URL}/smart_meal_planner/", json=payload)
+        response = post_with_inventory(
+            f"{MEAL_PLANNING_BASE_URL}/smart_meal_planner/",
+            {"dietary_preferences": dietary_preferences}
+        )
         
         if response.status_code == 200:
             return jsonify(response.json())
         else:
             return jsonify({"error": f"Meal planning service error: {response.text}"}), response.status_code
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to connect to meal planning service: {str(e)}"}), 500
 
@@ -71,41 +333,16 @@ def enhanced_shopping_list():
     Generate an enhanced shopping list based on inventory from the database,
     consumption trends and meal plans
     """
-    # Get inventory from the database
-    foods = mongo.db.Foods.find()
-    inventory = []
-    
-    for food in foods:
-        # Format inventory items to match the expected structure
-        inventory_item = {
-            "item_name": food.get('name', 'Unknown'),
-            "quantity": food.get('quantity', 0),
-            "unit": food.get('unit', 'g'),
-            "expiry_date": None
-        }
-        
-        # Convert expiry date if available
-        if 'expiryDate' in food and food['expiryDate']:
-            if isinstance(food['expiryDate'], datetime):
-                inventory_item["expiry_date"] = food['expiryDate'].strftime('%Y-%m-%d')
-            elif isinstance(food['expiryDate'], str):
-                inventory_item["expiry_date"] = food['expiryDate'].split('T')[0]  # Format ISO date
-        
-        inventory.append(inventory_item)
-    
-    # Prepare payload for the meal planning service
-    payload = {
-        "inventory": inventory
-    }
-    
-    # Make request to meal planning service
+    # Make request to meal planning service with the cached, versioned inventory
     try:
-        response = requests.post(f"{MEAL_PLANNING_BASE_URL}/enhanced_smart_shopping_list/", json=payload)
+        response = post_with_inventory(f"{MEAL_PLANNING_BASE_URL}/enhanced_smart_shopping_list/", {})
         
         if response.status_code == 200:
             return jsonify(response.json())
         else:
             return jsonify({"error": f"Shopping list service error: {response.text}"}), response.status_code
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to connect to meal planning service: {str(e)}"}), 500
 @app.route('/api/v1/foods', methods=['GET'])
@@ -121,90 +358,136 @@ def get_foods():
         response.append(food)
     return jsonify(response)
 
-@app.route('/api/v1/foods', methods=['POST'])
-def add_food():
-    food = request.json
-    
-    # Convert date strings to datetime objects if they exist in the request
+def parse_food_dates(food):
+    """Convert date strings in a food payload to datetime objects"""
     if 'boughtDate' in food and isinstance(food['boughtDate'], str):
         food['boughtDate'] = datetime.fromisoformat(food['boughtDate'])
     if 'expiryDate' in food and isinstance(food['expiryDate'], str):
         food['expiryDate'] = datetime.fromisoformat(food['expiryDate'])
+    return food
+
+def serialize_food(food):
+    """Convert a food document into a JSON friendly dict"""
+    food['_id'] = str(food['_id'])
+    if isinstance(food.get('boughtDate'), datetime):
+        food['boughtDate'] = food['boughtDate'].isoformat()
+    if isinstance(food.get('expiryDate'), datetime):
+        food['expiryDate'] = food['expiryDate'].isoformat()
+    return food
+
+def food_id_filter(id):
+    """Build the _id filter for either ObjectId or UUID style ids"""
+    if len(id) == 24:  # Likely ObjectId format
+        try:
+            return {'_id': ObjectId(id)}
+        except Exception:
+            pass
+    return {'_id': id}
+
+@app.route('/api/v1/foods', methods=['POST'])
+def add_food():
+    food = parse_food_dates(request.json)
     
     # Generate UUID if not provided
     if '_id' not in food:
         food['_id'] = str(uuid.uuid4())
     
-    food_id = mongo.db.Foods.insert_one(food).inserted_id
-    response = mongo.db.Foods.find_one({'_id': food_id})
-    response['_id'] = str(response['_id'])
+    # insert_one stores exactly this document, so echo it back instead of re-reading it
+    mongo.db.Foods.insert_one(food)
+    invalidate_inventory_cache()
+    return jsonify(serialize_food(food))
+
+@app.route('/api/v1/foods/bulk', methods=['POST'])
+def bulk_foods():
+    """
+    Apply a batch of insert/update/delete operations with a single bulk_write
+
+    Body: {"operations": [
+              {"op": "insert", "food": {...}},
+              {"op": "update", "id": "<id>", "food": {...}},
+              {"op": "delete", "id": "<id>"}
+          ],
+          "ordered": false}
+    """
+    data = request.json
+    if not data or not isinstance(data.get('operations'), list) or not data['operations']:
+        return jsonify({"error": "A non-empty list of operations is required"}), 400
+    ordered = data.get('ordered', False)
+    if not isinstance(ordered, bool):
+        return jsonify({"error": "ordered must be a boolean"}), 400
     
-    # Convert datetime objects to ISO strings for JSON response
-    if isinstance(response.get('boughtDate'), datetime):
-        response['boughtDate'] = response['boughtDate'].isoformat()
-    if isinstance(response.get('expiryDate'), datetime):
-        response['expiryDate'] = response['expiryDate'].isoformat()
+    requests_batch = []
+    inserted_ids = []
+    for index, operation in enumerate(data['operations']):
+        if not isinstance(operation, dict):
+            return jsonify({"error": f"Invalid operation at index {index}"}), 400
+        op = operation.get('op')
+        if op == 'insert' and isinstance(operation.get('food'), dict):
+            food = parse_food_dates(operation['food'])
+            if '_id' not in food:
+                food['_id'] = str(uuid.uuid4())
+            inserted_ids.append(str(food['_id']))
+            requests_batch.append(InsertOne(food))
+        elif op == 'update' and operation.get('id') and isinstance(operation.get('food'), dict):
+            food = parse_food_dates(operation['food'])
+            food.pop('_id', None)
+            requests_batch.append(UpdateOne(food_id_filter(str(operation['id'])), {'$set': food}))
+        elif op == 'delete' and operation.get('id'):
+            requests_batch.append(DeleteOne(food_id_filter(str(operation['id']))))
+        else:
+            return jsonify({"error": f"Invalid operation at index {index}"}), 400
     
-    return jsonify(response)
+    try:
+        result = mongo.db.Foods.bulk_write(requests_batch, ordered=ordered)
+    except BulkWriteError as e:
+        invalidate_inventory_cache()
+        details = e.details or {}
+        return jsonify({
+            "error": "Some operations failed",
+            "inserted_count": details.get('nInserted', 0),
+            "matched_count": details.get('nMatched', 0),
+            "modified_count": details.get('nModified', 0),
+            "deleted_count": details.get('nRemoved', 0),
+            "write_errors": [
+                {"index": err.get('index'), "message": err.get('errmsg')}
+                for err in details.get('writeErrors', [])
+            ]
+        }), 400
+    
+    invalidate_inventory_cache()
+    return jsonify({
+        "inserted_count": result.inserted_count,
+        "matched_count": result.matched_count,
+        "modified_count": result.modified_count,
+        "deleted_count": result.deleted_count,
+        "inserted_ids": inserted_ids
+    })
 
 @app.route('/api/v1/foods/<id>', methods=['GET'])
 def get_food(id):
-    # Check if ID is UUID format or ObjectId format
-    try:
-        if len(id) == 24:  # Likely ObjectId format
-            food = mongo.db.Foods.find_one({'_id': ObjectId(id)})
-        else:  # Likely UUID format
-            food = mongo.db.Foods.find_one({'_id': id})
-    except:
-        food = mongo.db.Foods.find_one({'_id': id})
-        
+    food = mongo.db.Foods.find_one(food_id_filter(id))
     if not food:
         return jsonify({"error": "Food not found"}), 404
         
-    food['_id'] = str(food['_id'])
-    
-    # Convert datetime objects to ISO strings for JSON response
-    if isinstance(food.get('boughtDate'), datetime):
-        food['boughtDate'] = food['boughtDate'].isoformat()
-    if isinstance(food.get('expiryDate'), datetime):
-        food['expiryDate'] = food['expiryDate'].isoformat()
-        
-    return jsonify(food)
+    return jsonify(serialize_food(food))
 
 @app.route('/api/v1/foods/<id>', methods=['PUT'])
 def update_food(id):
-    food = request.json
+    food = parse_food_dates(request.json)
+    food.pop('_id', None)
     
-    # Convert date strings to datetime objects if they exist in the request
-    if 'boughtDate' in food and isinstance(food['boughtDate'], str):
-        food['boughtDate'] = datetime.fromisoformat(food['boughtDate'])
-    if 'expiryDate' in food and isinstance(food['expiryDate'], str):
-        food['expiryDate'] = datetime.fromisoformat(food['expiryDate'])
-    
-    # Check if ID is UUID format or ObjectId format
-    try:
-        if len(id) == 24:  # Likely ObjectId format
-            mongo.db.Foods.update_one({'_id': ObjectId(id)}, {'$set': food})
-            response = mongo.db.Foods.find_one({'_id': ObjectId(id)})
-        else:  # Likely UUID format
-            mongo.db.Foods.update_one({'_id': id}, {'$set': food})
-            response = mongo.db.Foods.find_one({'_id': id})
-    except:
-        mongo.db.Foods.update_one({'_id': id}, {'$set': food})
-        response = mongo.db.Foods.find_one({'_id': id})
+    # Update and fetch the post-image in a single round trip
+    response = mongo.db.Foods.find_one_and_update(
+        food_id_filter(id),
+        {'$set': food},
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_inventory_cache()
     
     if not response:
         return jsonify({"error": "Food not found"}), 404
         
-    response['_id'] = str(response['_id'])
-    
-    # Convert datetime objects to ISO strings for JSON response
-    if isinstance(response.get('boughtDate'), datetime):
-        response['boughtDate'] = response['boughtDate'].isoformat()
-    if isinstance(response.get('expiryDate'), datetime):
-        response['expiryDate'] = response['expiryDate'].isoformat()
-        
-    return jsonify(response)
+    return jsonify(serialize_food(response))
 CONSUMPTION_SERVICE_BASE_URL = "http://localhost:8000"
 
 @app.route('/api/v1/consumption', methods=['POST'])
@@ -226,12 +509,14 @@ def log_consumption():
     
     # Make request to consumption logging service
     try:
-        response = requests.post(f"{CONSUMPTION_SERVICE_BASE_URL}/log_consumption/", json=payload)
+        response = upstream_request("post", f"{CONSUMPTION_SERVICE_BASE_URL}/log_consumption/", json=payload)
         
         if response.status_code == 200:
             return jsonify(response.json())
         else:
             return jsonify({"error": f"Consumption logging service error: {response.text}"}), response.status_code
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to connect to consumption service: {str(e)}"}), 500
 
@@ -242,12 +527,14 @@ def predict_consumption(item_name):
     """
     # Make request to prediction service
     try:
-        response = requests.get(f"{CONSUMPTION_SERVICE_BASE_URL}/predict/{item_name}")
+        response = upstream_request("get", f"{CONSUMPTION_SERVICE_BASE_URL}/predict/{item_name}")
         
         if response.status_code == 200:
             return jsonify(response.json())
         else:
             return jsonify({"error": f"Prediction service error: {response.text}"}), response.status_code
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to connect to prediction service: {str(e)}"}), 500
 
@@ -258,27 +545,22 @@ def predict_expiry():
     """
     # Make request to expiry prediction service
     try:
-        response = requests.get(f"{CONSUMPTION_SERVICE_BASE_URL}/predict_expiry/")
+        response = upstream_request("get", f"{CONSUMPTION_SERVICE_BASE_URL}/predict_expiry/")
         
         if response.status_code == 200:
             return jsonify(response.json())
         else:
             return jsonify({"error": f"Expiry prediction service error: {response.text}"}), response.status_code
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to connect to expiry prediction service: {str(e)}"}), 500
 @app.route('/api/v1/foods/<id>', methods=['DELETE'])
 def delete_food(id):
-    # Check if ID is UUID format or ObjectId format
-    try:
-        if len(id) == 24:  # Likely ObjectId format
-            result = mongo.db.Foods.delete_one({'_id': ObjectId(id)})
-        else:  # Likely UUID format
-            result = mongo.db.Foods.delete_one({'_id': id})
-    except:
-        result = mongo.db.Foods.delete_one({'_id': id})
-    
+    result = mongo.db.Foods.delete_one(food_id_filter(id))
     if result.deleted_count == 0:
         return jsonify({"error": "Food not found"}), 404
+    invalidate_inventory_cache()
         
     response = {'message': 'Food with id ' + id + ' has been deleted'}
     return jsonify(response)
@@ -1,4 +1,6 @@
 import os
+import json
+import time
 import requests
 from moya.conversation.thread import Thread
 from moya.tools.base_tool import BaseTool
@@ -8,10 +10,21 @@ from moya.registry.agent_registry import AgentRegistry
 from moya.orchestrators.simple_orchestrator import SimpleOrchestrator
 from moya.agents.azure_openai_agent import AzureOpenAIAgent, AzureOpenAIAgentConfig
 from moya.conversation.message import Message
+from models import predictor
+from consumption_store import consumption_store
 
 FASTAPI_URL = "http://127.0.0.1:8000"
 
-def predict_consumption(item_name: str) -> str:
+# "inprocess" runs predictions against the local consumption log, "http" calls
+# the FastAPI service, "auto" uses in-process when the log is available locally
+TOOL_BACKEND = os.getenv("CHAT_TOOL_BACKEND", "auto")
+
+def use_inprocess_backend() -> bool:
+    if TOOL_BACKEND == "http":
+        return False
+    return TOOL_BACKEND == "inprocess" or consumption_store.exists()
+
+def predict_consumption_http(item_name: str) -> str:
     """ Fetch consumption prediction from FastAPI """
     response = requests.get(f"{FASTAPI_URL}/predict/{item_name}")
     if response.status_code == 200:
@@ -19,6 +32,51 @@ def predict_consumption(item_name: str) -> str:
     else:
         return response.json()["detail"]
 
+def predict_consumption(item_name: str) -> str:
+    """ Predict consumption in-process, falling back to the FastAPI service """
+    if use_inprocess_backend():
+        try:
+            return predictor.consumption_predictor.predict(item_name)["prediction"]
+        except ValueError as e:
+            return str(e)
+        except Exception as e:
+            print(f"In-process prediction failed, falling back to HTTP: {e}")
+    return predict_consumption_http(item_name)
+
+def predict_consumption_many(item_names: list) -> str:
+    """ Predict consumption for several items with a single tool call """
+    if use_inprocess_backend():
+        try:
+            results = predictor.consumption_predictor.predict_many(item_names)
+            return json.dumps({
+                item_name: result["prediction"] if result["status"] == "success" else result["detail"]
+                for item_name, result in results.items()
+            })
+        except Exception as e:
+            print(f"In-process prediction failed, falling back to HTTP: {e}")
+    return json.dumps({item_name: predict_consumption_http(item_name) for item_name in item_names})
+
+def list_low_stock_items(threshold_days: float = 5) -> str:
+    """ List items predicted to run out within threshold_days """
+    threshold_days = float(threshold_days)
+    if use_inprocess_backend():
+        try:
+            items = predictor.consumption_predictor.low_stock(threshold_days)
+            return json.dumps([
+                {"item_name": item["item_name"], "days_until_empty": item["days_until_empty"], "refill_date": item["refill_date"]}
+                for item in items
+            ])
+        except Exception as e:
+            print(f"In-process low stock lookup failed, falling back to HTTP: {e}")
+
+    items = []
+    for item_name in requests.get(f"{FASTAPI_URL}/items/").json().get("items", []):
+        response = requests.get(f"{FASTAPI_URL}/predict/{item_name}")
+        if response.status_code == 200 and response.json()["days_until_empty"] < threshold_days:
+            result = response.json()
+            items.append({"item_name": item_name, "days_until_empty": result["days_until_empty"], "refill_date": result["refill_date"]})
+    return json.dumps(sorted(items, key=lambda item: item["days_until_empty"]))
+
 def setup_agent():
     """ Set up the AI agent with the consumption prediction tool """
 
@@ -39,6 +97,35 @@ def setup_agent():
     )
     tool_registry.register_tool(predict_consumption_tool)
 
+    predict_consumption_many_tool = BaseTool(
+        name="predict_consumption_many_tool",
+        description="Predict when each of several items will run out, in one call",
+        function=predict_consumption_many,
+        parameters={
+            "item_names": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "The item names for consumption prediction"
+            }
+        },
+        required=["item_names"]
+    )
+    tool_registry.register_tool(predict_consumption_many_tool)
+
+    list_low_stock_items_tool = BaseTool(
+        name="list_low_stock_items_tool",
+        description="List all items predicted to run out within the given number of days",
+        function=list_low_stock_items,
+        parameters={
+            "threshold_days": {
+                "type": "number",
+                "description": "Include items running out within this many days (default 5)"
+            }
+        },
+        required=[]
+    )
+    tool_registry.register_tool(list_low_stock_items_tool)
+
     agent_config = AzureOpenAIAgentConfig(
         agent_name="consumption_chat_agent",
         description="AI agent for consumption prediction",
@@ -48,6 +135,8 @@ def setup_agent():
         system_prompt="""
             You are an AI assistant that predicts when an item will run out based on user consumption habits.
             Use the 'predict_consumption_tool' to fetch predictions.
+            When asked about several items, use 'predict_consumption_many_tool' once instead of one call per item.
+            Use 'list_low_stock_items_tool' to find what is running low.
         """,
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         api_base=os.getenv("AZURE_OPENAI_ENDPOINT"),
@@ -61,21 +150,104 @@ def setup_agent():
     orchestrator = SimpleOrchestrator(agent_registry=agent_registry, default_agent_name="consumption_chat_agent")
     return orchestrator, agent
 
+def stream_reply(agent, user_message: str, on_chunk) -> str:
+    """
+    Answer user_message with the agent's tools, passing content to on_chunk as
+    the Azure client streams it. moya's handle_message_stream only returns the
+    finished reply, so this runs the same tool loop as OpenAIAgent.handle
+    with stream=True on the chat completions call.
+    """
+    conversation = [
+        {"role": "system", "content": agent.system_prompt},
+        {"role": "user", "content": user_message}
+    ]
+    tools = agent.get_tool_definitions() or None
+    content = ""
+    # Duplicates the tool-call loop in moya's OpenAIAgent.handle (moya 0.1.5),
+    # whose handle_message_stream returns the whole reply as one string. Keep
+    # the two in step when the tool protocol changes; tool execution itself
+    # still goes through agent.handle_tool_call. Drop this once moya streams.
+    for _ in range(agent.max_iterations):
+        response = agent.client.chat.completions.create(
+            model=agent.model_name,
+            messages=conversation,
+            tools=tools,
+            tool_choice=agent.tool_choice if tools else None,
+            stream=True
+        )
+        content = ""
+        tool_calls = []
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content += delta.content
+                on_chunk(delta.content)
+            for tool_call_delta in delta.tool_calls or []:
+                while len(tool_calls) <= tool_call_delta.index:
+                    tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                tool_call = tool_calls[tool_call_delta.index]
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function and tool_call_delta.function.name:
+                    tool_call["function"]["name"] = tool_call_delta.function.name
+                if tool_call_delta.function and tool_call_delta.function.arguments:
+                    tool_call["function"]["arguments"] += tool_call_delta.function.arguments
+
+        entry = {"role": "assistant", "content": content}
+        if tool_calls:
+            entry["tool_calls"] = tool_calls
+        conversation.append(entry)
+        if not tool_calls:
+            break
+        for tool_call in tool_calls:
+            conversation.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": str(agent.handle_tool_call(tool_call))
+            })
+    return content
+
 def main():
     orchestrator, agent = setup_agent()
 
+    # CHAT_STREAM=0 waits for the full response; CHAT_TIMINGS=1 prints latency per turn
+    stream = os.getenv("CHAT_STREAM", "1") != "0"
+    show_timings = os.getenv("CHAT_TIMINGS", "0") == "1"
+
     while True:
         user_input = input("\nYou: ").strip()
         if user_input.lower() in ['quit', 'exit']:
             print("\nGoodbye!")
             break
 
-        response = orchestrator.orchestrate(
-            thread_id="consumption_chat_001",
-            user_message=user_input
-        )
+        start = time.perf_counter()
+        first_token_at = None
+
+        if stream:
+            print("\nAssistant: ", end="", flush=True)
+
+            def print_chunk(chunk):
+                nonlocal first_token_at
+                if first_token_at is None and chunk:
+                    first_token_at = time.perf_counter()
+                print(chunk, end="", flush=True)
+
+            stream_reply(agent, user_input, print_chunk)
+            print()
+        else:
+            response = orchestrator.orchestrate(
+                thread_id="consumption_chat_001",
+                user_message=user_input
+            )
+            first_token_at = time.perf_counter()
+            print("\nAssistant:", response)
 
-        print("\nAssistant:", response)
+        if show_timings:
+            total = time.perf_counter() - start
+            ttft = (first_token_at - start) if first_token_at else total
+            print(f"[time to first token: {ttft:.2f}s, total: {total:.2f}s]")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,391 @@
+"""
+Monthly-partitioned consumption log.
+
+Rows live in data/consumption_log/YYYY-MM.csv, one file per month of
+date_consumed. Readers take the newest CONSUMPTION_LOOKBACK_MONTHS
+partitions (months with no rows don't count, so a quiet spell doesn't empty
+the window), so reads no longer pay for all of history. compact() rolls
+partitions older than the window into per-item
+summaries (gzip CSV) that keep long-horizon usage statistics: row and usage
+totals, first/last dates, Welford mean/M2 of daily usage and usage per
+weekday.
+
+The old single data/consumption_log.csv is split into partitions the first
+time the store is used and is left in place untouched.
+
+Writers may be separate processes (several uvicorn workers). Appends,
+seeding, the legacy split and compaction hold an exclusive lock on
+<directory>/.lock, and each append is a single O_APPEND write per partition,
+so concurrent writers never lose or interleave rows. Readers take no lock.
+
+    python consumption_store.py compact [keep_months]
+    python consumption_store.py stress [processes] [writes_per_process]
+"""
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import Process
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LEGACY_CSV_FILE = "data/consumption_log.csv"
+CONSUMPTION_LOG_DIR = os.environ.get("CONSUMPTION_LOG_DIR", "data/consumption_log")
+CONSUMPTION_LOOKBACK_MONTHS = int(os.environ.get("CONSUMPTION_LOOKBACK_MONTHS", "6"))  # 0 reads everything
+# How often the API compacts partitions older than the lookback window (0 disables)
+COMPACTION_INTERVAL_SECONDS = float(os.environ.get("CONSUMPTION_COMPACTION_INTERVAL_SECONDS", str(24 * 3600)))
+
+COLUMNS = ["item_name", "date_consumed", "quantity_used", "remaining_stock"]
+SUMMARY_COLUMNS = (
+    ["item_name", "rows", "total_used", "first_date", "last_date", "last_remaining", "rate_count", "rate_mean", "rate_m2"]
+    + [f"weekday_{day}_used" for day in range(7)]
+)
+
+PARTITION_PATTERN = re.compile(r"^(\d{4}-\d{2})\.csv$")
+SUMMARY_PATTERN = re.compile(r"^summaries-(\d{4}-\d{2})\.csv\.gz$")
+
+
+def _month_of(dates: pd.Series) -> pd.Series:
+    """YYYY-MM for each date; undated rows go to the current month"""
+    parsed = pd.to_datetime(dates, format="mixed", errors="coerce")
+    return parsed.dt.strftime("%Y-%m").fillna(datetime.now().strftime("%Y-%m"))
+
+
+@contextmanager
+def _locked(path: str):
+    """Exclusive lock on path across processes, held for the with block"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class ConsumptionStore:
+    def __init__(self, directory: str = CONSUMPTION_LOG_DIR, legacy_csv: Optional[str] = LEGACY_CSV_FILE,
+                 lookback_months: int = CONSUMPTION_LOOKBACK_MONTHS):
+        self.directory = directory
+        self.legacy_csv = legacy_csv
+        self.lookback_months = lookback_months
+        self._lock = Lock()
+        self._checked = False
+
+    # Layout
+
+    def _months(self) -> List[str]:
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        return sorted(match.group(1) for match in map(PARTITION_PATTERN.match, names) if match)
+
+    def summary_path(self) -> Optional[str]:
+        """Latest summaries file; its month is the last one compacted"""
+        paths = sorted(glob.glob(os.path.join(self.directory, "summaries-*.csv.gz")))
+        return paths[-1] if paths else None
+
+    def compacted_through(self) -> Optional[str]:
+        path = self.summary_path()
+        return SUMMARY_PATTERN.match(os.path.basename(path)).group(1) if path else None
+
+    @contextmanager
+    def write_lock(self):
+        """Exclusive across threads and processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, _locked(os.path.join(self.directory, ".lock")):
+            yield
+
+    def _ensure_partitioned(self):
+        """Split the legacy single-file log into monthly partitions once"""
+        if self._checked:
+            return
+        with self.write_lock():
+            if self._checked:
+                return
+            if not self._months() and not self.summary_path() and self.legacy_csv and os.path.exists(self.legacy_csv):
+                legacy = pd.read_csv(self.legacy_csv)
+                for month, rows in legacy.groupby(_month_of(legacy["date_consumed"]), sort=True):
+                    path = os.path.join(self.directory, f"{month}.csv")
+                    rows[COLUMNS].to_csv(path + ".tmp", index=False)
+                    os.replace(path + ".tmp", path)
+            self._checked = True
+
+    def partitions(self, lookback_months: Optional[int] = None) -> List[str]:
+        """Partition files inside the lookback window, oldest first"""
+        self._ensure_partitioned()
+        lookback_months = self.lookback_months if lookback_months is None else lookback_months
+        months = self._months()
+        through = self.compacted_through()
+        if through:
+            months = [month for month in months if month > through]
+        if lookback_months > 0:
+            months = months[-lookback_months:]
+        return [os.path.join(self.directory, f"{month}.csv") for month in months]
+
+    def exists(self) -> bool:
+        return bool(self.partitions(0) or self.summary_path())
+
+    def signature(self, lookback_months: Optional[int] = None) -> Tuple:
+        """Changes whenever a partition in the window or the summaries change"""
+        def entry(path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            return os.path.basename(path), stat.st_mtime_ns, stat.st_size
+
+        entries = tuple(filter(None, map(entry, self.partitions(lookback_months))))
+        summary_path = self.summary_path()
+        return entries, entry(summary_path) if summary_path else None
+
+    # Reads and writes
+
+    def read(self, lookback_months: Optional[int] = None, parse_dates: bool = False) -> pd.DataFrame:
+        """Rows from the partitions in the window (all partitions with lookback_months=0)"""
+        frames = []
+        for path in self.partitions(lookback_months):
+            try:
+                frames.append(pd.read_csv(path))
+            except (OSError, pd.errors.EmptyDataError):
+                continue
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+        if parse_dates:
+            df["date_consumed"] = pd.to_datetime(df["date_consumed"], format="mixed", errors="coerce")
+        return df
+
+    def append(self, rows: Iterable[Dict]):
+        """Append rows to their month partitions; safe with concurrent writers in other processes"""
+        self._ensure_partitioned()
+        with self.write_lock():
+            self._append(rows)
+
+    def seed(self, rows: Iterable[Dict]) -> bool:
+        """Append rows only if the store is empty, atomically; True if they were written"""
+        self._ensure_partitioned()
+        with self.write_lock():
+            if self.exists():
+                return False
+            self._append(rows)
+            return True
+
+    def _append(self, rows: Iterable[Dict]):
+        df = pd.DataFrame(list(rows), columns=COLUMNS)
+        months = _month_of(df["date_consumed"])
+
+        # Rows for months already compacted would land in partitions readers
+        # skip, so they go straight into the summaries
+        through = self.compacted_through()
+        if through:
+            late = months <= through
+            if late.any():
+                self._write_summaries(summarize(df[late], self.summaries()), through)
+                df, months = df[~late], months[~late]
+
+        for month, group in df.groupby(months, sort=True):
+            path = os.path.join(self.directory, f"{month}.csv")
+            data = group.to_csv(index=False, header=False).encode("utf-8")
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    data = (",".join(COLUMNS) + "\n").encode("utf-8") + data
+                _write_all(fd, data)
+            finally:
+                os.close(fd)
+
+    def summaries(self) -> pd.DataFrame:
+        """Per-item summaries of compacted partitions (empty before the first compaction)"""
+        path = self.summary_path()
+        if not path:
+            return pd.DataFrame(columns=SUMMARY_COLUMNS)
+        return pd.read_csv(path, compression="gzip", parse_dates=["first_date", "last_date"])
+
+    # Compaction
+
+    def compact(self, keep_months: Optional[int] = None) -> Optional[str]:
+        """
+        Roll all but the newest keep_months partitions into the
+        summaries and delete them. Writing the new summaries file is the commit
+        point; partitions it covers are ignored by readers even if a crash
+        leaves them behind. Returns the new summaries path, or None.
+        """
+        keep_months = self.lookback_months if keep_months is None else keep_months
+        self._ensure_partitioned()
+        with self.write_lock():
+            return self._compact(keep_months)
+
+    def _compact(self, keep_months: int) -> Optional[str]:
+        months = [os.path.basename(path)[:-4] for path in self.partitions(0)]
+        if keep_months <= 0 or len(months) <= keep_months:
+            return None
+        old = months[:-keep_months]
+
+        rows = pd.concat([pd.read_csv(os.path.join(self.directory, f"{month}.csv")) for month in old], ignore_index=True)
+        path = self._write_summaries(summarize(rows, self.summaries()), old[-1])
+
+        for month in old:
+            os.remove(os.path.join(self.directory, f"{month}.csv"))
+        for previous in glob.glob(os.path.join(self.directory, "summaries-*.csv.gz")):
+            if previous != path:
+                os.remove(previous)
+        return path
+
+    def _write_summaries(self, summaries: pd.DataFrame, through: str) -> str:
+        path = os.path.join(self.directory, f"summaries-{through}.csv.gz")
+        summaries.to_csv(path + ".tmp", index=False, compression="gzip")
+        os.replace(path + ".tmp", path)
+        return path
+
+
+def summarize(rows: pd.DataFrame, previous: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Fold consumption rows into per-item summaries, merging with previous
+    summaries. Daily usage is computed as in the predictors (usage over days
+    since the item's previous event, at least one day), and the mean/M2 of
+    the new rows is combined with the old with the parallel Welford update.
+    """
+    previous = previous if previous is not None else pd.DataFrame(columns=SUMMARY_COLUMNS)
+    by_item = {row["item_name"]: row for row in previous.to_dict("records")}
+
+    rows = rows.dropna(subset=["item_name"]).copy()
+    rows["date_consumed"] = pd.to_datetime(rows["date_consumed"], format="mixed", errors="coerce")
+    rows = rows.sort_values(["item_name", "date_consumed"], kind="stable")
+
+    for item_name, group in rows.groupby("item_name", sort=False):
+        old = by_item.get(item_name)
+        dates = group["date_consumed"]
+        used = group["quantity_used"].to_numpy(dtype=float)
+
+        days = dates.diff().dt.days
+        if old is not None and not pd.isna(old["last_date"]) and not pd.isna(dates.iloc[0]):
+            days.iloc[0] = (dates.iloc[0] - pd.Timestamp(old["last_date"])).days
+        rates = used / days.fillna(1).clip(lower=1).to_numpy()
+        rates = rates[np.isfinite(rates)]
+
+        count = len(rates)
+        mean = float(rates.mean()) if count else 0.0
+        m2 = float(((rates - mean) ** 2).sum()) if count else 0.0
+        weekday_used = np.bincount(dates.dt.weekday.dropna().astype(int), weights=used[dates.notna().to_numpy()], minlength=7)
+
+        summary = {
+            "item_name": item_name,
+            "rows": len(group),
+            "total_used": float(used.sum()),
+            "first_date": dates.min(),
+            "last_date": dates.max(),
+            "last_remaining": float(group["remaining_stock"].iloc[-1]),
+            "rate_count": count,
+            "rate_mean": mean,
+            "rate_m2": m2,
+            **{f"weekday_{day}_used": float(weekday_used[day]) for day in range(7)}
+        }
+        if old is not None:
+            if not pd.isna(old["last_date"]) and not summary["last_date"] >= pd.Timestamp(old["last_date"]):
+                summary["last_remaining"] = old["last_remaining"]  # late rows don't change current stock
+            total = old["rate_count"] + count
+            delta = mean - old["rate_mean"]
+            summary.update({
+                "rows": old["rows"] + summary["rows"],
+                "total_used": old["total_used"] + summary["total_used"],
+                "first_date": min(pd.Timestamp(old["first_date"]), summary["first_date"]),
+                "last_date": max(pd.Timestamp(old["last_date"]), summary["last_date"]),
+                "rate_count": total,
+                "rate_mean": old["rate_mean"] + delta * count / total if total else 0.0,
+                "rate_m2": old["rate_m2"] + m2 + delta ** 2 * old["rate_count"] * count / total if total else 0.0,
+                **{f"weekday_{day}_used": old[f"weekday_{day}_used"] + summary[f"weekday_{day}_used"] for day in range(7)}
+            })
+        by_item[item_name] = summary
+
+    return pd.DataFrame(list(by_item.values()), columns=SUMMARY_COLUMNS)
+
+
+consumption_store = ConsumptionStore()
+
+
+def _stress_writer(directory: str, legacy_csv: str, writer: int, writes: int):
+    """One row per append, alternating between two months so partitions are created concurrently"""
+    store = ConsumptionStore(directory, legacy_csv)
+    for seq in range(writes):
+        month = "2025-01" if seq % 2 else "2025-02"
+        store.append([{"item_name": f"writer_{writer}", "date_consumed": f"{month}-{seq % 28 + 1:02d}",
+                       "quantity_used": seq, "remaining_stock": 0}])
+
+
+def _stress_compactor(directory: str, legacy_csv: str, rounds: int):
+    store = ConsumptionStore(directory, legacy_csv)
+    for _ in range(rounds):
+        store.compact(1)
+        time.sleep(0.01)
+
+
+def stress_test(processes: int = 8, writes: int = 500):
+    """
+    Fire processes * writes concurrent single-row appends from separate
+    processes (each racing to split a legacy log first) while another
+    process compacts, then assert every row is accounted for: still in a
+    partition exactly once, or counted in the summaries.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, "consumption_log")
+        legacy_csv = os.path.join(tmp, "consumption_log.csv")
+        legacy = pd.DataFrame({"item_name": "legacy", "date_consumed": "2024-12-01",
+                               "quantity_used": range(100), "remaining_stock": 0})
+        legacy.to_csv(legacy_csv, index=False)
+
+        workers = [Process(target=_stress_writer, args=(directory, legacy_csv, writer, writes)) for writer in range(processes)]
+        workers.append(Process(target=_stress_compactor, args=(directory, legacy_csv, 20)))
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        assert all(worker.exitcode == 0 for worker in workers), "a stress process failed"
+
+        store = ConsumptionStore(directory, legacy_csv)
+        rows = store.read(0)
+        summarized = int(store.summaries()["rows"].sum())
+        expected = processes * writes + len(legacy)
+        duplicates = int(rows.duplicated(["item_name", "quantity_used"]).sum())
+        print(f"{processes * writes} appends from {processes} processes in {elapsed:.2f} s: "
+              f"{len(rows)} rows in partitions + {summarized} compacted = {len(rows) + summarized} of {expected}")
+        assert duplicates == 0, f"{duplicates} duplicated rows"
+        assert len(rows) + summarized == expected, "rows were lost"
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["compact"]:
+        keep = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        result = consumption_store.compact(keep)
+        print(f"Compacted into {result}" if result else "Nothing to compact")
+    elif sys.argv[1:2] == ["stress"]:
+        stress_test(*(int(arg) for arg in sys.argv[2:4]))
@@ -0,0 +1,121 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from moya.tools.ephemeral_memory import EphemeralMemory
+
+MAX_THREADS = int(os.environ.get("CONVERSATION_MAX_THREADS", "1000"))
+THREAD_TTL_SECONDS = float(os.environ.get("CONVERSATION_TTL_SECONDS", "3600"))
+MAX_MESSAGES_PER_THREAD = int(os.environ.get("CONVERSATION_MAX_MESSAGES", "50"))
+# How often the service sweeps, since agent memory tools write threads without going through store_message
+SWEEP_INTERVAL_SECONDS = float(os.environ.get("CONVERSATION_SWEEP_INTERVAL_SECONDS", "60"))
+
+
+class BoundedMemory:
+    """
+    Bounded layer over EphemeralMemory's in-memory repository.
+
+    Threads are kept in least-recently-used order and evicted when there are
+    more than max_threads of them or when they have been idle for ttl_seconds.
+    Each thread keeps at most max_messages messages (oldest dropped first).
+
+    store_message enforces the bounds as it writes. Threads written directly
+    by the agent memory tools are only seen by sweep(), which the service
+    runs every SWEEP_INTERVAL_SECONDS.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = MAX_THREADS,
+        ttl_seconds: float = THREAD_TTL_SECONDS,
+        max_messages: int = MAX_MESSAGES_PER_THREAD
+    ):
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = Lock()
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.trimmed_messages = 0
+
+    @property
+    def repository(self):
+        return EphemeralMemory.memory_repository
+
+    def store_message(self, thread_id: str, sender: str, content: str, metadata: Optional[dict] = None) -> str:
+        """Store a message through EphemeralMemory and enforce the bounds"""
+        with self._lock:
+            result = EphemeralMemory.store_message(
+                thread_id=thread_id, sender=sender, content=content, metadata=metadata
+            )
+            self._trim(thread_id)
+            self._last_used[thread_id] = time.time()
+            self._last_used.move_to_end(thread_id)
+            self._evict()
+        return result
+
+    def release(self, thread_id: str):
+        """Drop a one-shot thread as soon as its request is done"""
+        with self._lock:
+            self._last_used.pop(thread_id, None)
+            self.repository.delete_thread(thread_id)
+
+    def sweep(self):
+        """Evict idle threads and trim long ones, adopting threads stored directly by agent memory tools"""
+        with self._lock:
+            now = time.time()
+            for thread_id in self.repository.list_threads():
+                if thread_id not in self._last_used:
+                    self._last_used[thread_id] = now
+                self._trim(thread_id)
+            self._evict()
+
+    def _trim(self, thread_id: str):
+        thread = self.repository.get_thread(thread_id)
+        if thread and len(thread.messages) > self.max_messages:
+            overflow = len(thread.messages) - self.max_messages
+            del thread.messages[:overflow]
+            self.trimmed_messages += overflow
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_seconds
+        while self._last_used:
+            thread_id, last_used = next(iter(self._last_used.items()))
+            if last_used < cutoff:
+                self.evicted_ttl += 1
+            elif len(self._last_used) > self.max_threads:
+                self.evicted_lru += 1
+            else:
+                break
+            self._last_used.popitem(last=False)
+            self.repository.delete_thread(thread_id)
+
+    def stats(self) -> dict:
+        """Memory usage metrics for monitoring"""
+        with self._lock:
+            thread_ids = self.repository.list_threads()
+            message_count = 0
+            content_bytes = 0
+            for thread_id in thread_ids:
+                thread = self.repository.get_thread(thread_id)
+                if not thread:
+                    continue
+                message_count += len(thread.messages)
+                content_bytes += sum(len(str(message.content)) for message in thread.messages)
+
+            return {
+                "threads": len(thread_ids),
+                "messages": message_count,
+                "content_bytes": content_bytes,
+                "max_threads": self.max_threads,
+                "ttl_seconds": self.ttl_seconds,
+                "max_messages_per_thread": self.max_messages,
+                "evicted_lru": self.evicted_lru,
+                "evicted_ttl": self.evicted_ttl,
+                "trimmed_messages": self.trimmed_messages
+            }
+
+
+conversation_memory = BoundedMemory()
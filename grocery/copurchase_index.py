@@ -0,0 +1,80 @@
+import math
+from collections import Counter, defaultdict
+from itertools import combinations
+from threading import Lock
+from typing import Dict, List
+import pandas as pd
+
+from consumption_store import consumption_store
+
+TOP_K = 3
+MIN_COOCCURRENCES = 1
+
+
+class CoPurchaseIndex:
+    """
+    Item-to-item similarity from the consumption log: two items are related
+    when they are consumed on the same days. Scores are cosine similarities
+    over day-occurrence counts, and the top matches for every item are
+    precomputed so lookups are a single dict access.
+
+    The index is built from the store's lookback window and rebuilt lazily
+    whenever the store's signature (partition mtimes and sizes) changes.
+    """
+
+    def __init__(self, store=consumption_store, top_k: int = TOP_K, min_cooccurrences: int = MIN_COOCCURRENCES):
+        self.store = store
+        self.top_k = top_k
+        self.min_cooccurrences = min_cooccurrences
+        self._similar: Dict[str, List[str]] = {}
+        self._signature = None
+        self._lock = Lock()
+
+    def build(self, df: pd.DataFrame):
+        """Build the index from a consumption log frame"""
+        df = df.dropna(subset=["item_name", "date_consumed"])
+        days = pd.to_datetime(df["date_consumed"], format="mixed", errors="coerce").dt.date
+        keys = df["item_name"].str.strip().str.lower()
+
+        display_names = {}
+        for key, name in zip(keys, df["item_name"].str.strip()):
+            display_names.setdefault(key, name)
+
+        baskets = pd.DataFrame({"day": days, "item": keys}).dropna().drop_duplicates()
+        item_days = Counter(baskets["item"])
+        pair_counts = Counter()
+        for items in baskets.groupby("day")["item"]:
+            for a, b in combinations(sorted(items[1]), 2):
+                pair_counts[(a, b)] += 1
+
+        scores = defaultdict(list)
+        for (a, b), count in pair_counts.items():
+            if count < self.min_cooccurrences:
+                continue
+            score = count / math.sqrt(item_days[a] * item_days[b])
+            scores[a].append((score, b))
+            scores[b].append((score, a))
+
+        self._similar = {
+            item: [display_names[other] for _, other in sorted(matches, key=lambda m: (-m[0], m[1]))[:self.top_k]]
+            for item, matches in scores.items()
+        }
+
+    def refresh(self):
+        """Rebuild from the store if it changed since the last build"""
+        signature = self.store.signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            self.build(self.store.read())
+            self._signature = signature
+
+    def similar(self, item_name: str) -> List[str]:
+        """Top related items, or an empty list for items the log has never paired"""
+        self.refresh()
+        return self._similar.get(item_name.strip().lower(), [])
+
+
+copurchase_index = CoPurchaseIndex()
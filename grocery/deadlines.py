@@ -0,0 +1,67 @@
+import contextvars
+import time
+from typing import Optional
+
+# Clients send their remaining time budget in milliseconds
+DEADLINE_HEADER = b"x-deadline-ms"
+DEGRADED_HEADER = b"x-degraded"
+
+# Per-request state: {"deadline": monotonic seconds or None, "degraded": bool}.
+# A mutable dict so flags set inside child tasks are visible to the middleware.
+_request_state: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_state", default=None)
+
+
+def remaining(default: float) -> float:
+    """Seconds left for an upstream call: the call's own default, capped by the request deadline"""
+    state = _request_state.get()
+    if not state or state["deadline"] is None:
+        return default
+    return max(0.0, min(default, state["deadline"] - time.monotonic()))
+
+
+def mark_degraded():
+    """Flag the current request's response as a degraded (fallback) result"""
+    state = _request_state.get()
+    if state is not None:
+        state["degraded"] = True
+
+
+def is_degraded() -> bool:
+    state = _request_state.get()
+    return bool(state and state["degraded"])
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware that reads the X-Deadline-Ms request header into a
+    per-request deadline for LLM calls, and adds "X-Degraded: true" to the
+    response when a handler fell back to a degraded result.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = None
+        for name, value in scope.get("headers", []):
+            if name == DEADLINE_HEADER:
+                try:
+                    deadline = time.monotonic() + float(value) / 1000.0
+                except ValueError:
+                    pass
+        state = {"deadline": deadline, "degraded": False}
+        token = _request_state.set(state)
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start" and state["degraded"]:
+                message = dict(message, headers=list(message.get("headers", [])) + [(DEGRADED_HEADER, b"true")])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            _request_state.reset(token)
@@ -0,0 +1,60 @@
+import asyncio
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    ASGI middleware that cancels the request handler when the client
+    disconnects, so it stops awaiting AI work (llm_scheduler.run) and skips
+    whatever it would have done next. An LLM call already on a worker thread
+    can't be interrupted; it finishes and its result is discarded.
+
+    A watcher is the only reader of the server's receive channel for every
+    http request: it hands body messages to the handler through a queue, so
+    handlers that never read the body (GET) are covered too. The disconnect
+    that follows a completed response is normal and doesn't cancel anything.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        messages = asyncio.Queue()
+        state = {"response_done": False, "disconnected": False, "cancelled": False}
+
+        async def wrapped_receive():
+            if state["disconnected"] and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["response_done"] = True
+            await send(message)
+
+        handler = asyncio.ensure_future(self.app(scope, wrapped_receive, wrapped_send))
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    state["disconnected"] = True
+                    messages.put_nowait(message)
+                    if not state["response_done"]:
+                        state["cancelled"] = True
+                        handler.cancel()
+                    return
+                messages.put_nowait(message)
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not state["cancelled"]:
+                raise
+            print(f"Client disconnected, cancelled {scope.get('path')}")
+        finally:
+            watcher.cancel()
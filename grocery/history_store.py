@@ -0,0 +1,344 @@
+import io
+import json
+import os
+import shutil
+import time
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
+
+from consumption_store import COLUMNS, consumption_store
+
+ARROW_AVAILABLE = pa is not None
+
+HISTORY_STORE_DIR = os.environ.get("HISTORY_STORE_DIR", "data/history_store")
+# Appended rows held in memory before they are folded into a new build
+HISTORY_REBUILD_PENDING_ROWS = int(os.environ.get("HISTORY_REBUILD_PENDING_ROWS", "10000"))
+EXPORT_CHUNK_ROWS = 10000
+
+_COLUMNS = ("dates", "quantity_used", "remaining_stock")
+# Bytes before a read offset that must be unchanged for an append-only refresh
+_GUARD_BYTES = 256
+
+
+def _complete_lines(data: bytes) -> bytes:
+    """Drop a partially written last line"""
+    return data[:data.rfind(b"\n") + 1]
+
+
+def _to_arrays(df: pd.DataFrame):
+    """Item names and column arrays for rows with a parseable date, sorted by (item, date)"""
+    df = df.copy()
+    df["date_consumed"] = pd.to_datetime(df["date_consumed"], format="mixed", errors="coerce")
+    df = df.dropna(subset=["item_name", "date_consumed"]).sort_values(["item_name", "date_consumed"], kind="stable")
+    return df["item_name"].to_numpy(), {
+        "dates": df["date_consumed"].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]"),
+        "quantity_used": df["quantity_used"].to_numpy(dtype=np.float64),
+        "remaining_stock": df["remaining_stock"].to_numpy(dtype=np.float64)
+    }
+
+
+def _item_bounds(names: np.ndarray) -> Dict[str, Tuple[int, int]]:
+    """item -> [start, end) for names sorted by item"""
+    if not len(names):
+        return {}
+    boundaries = np.flatnonzero(names[1:] != names[:-1]) + 1
+    return {
+        str(names[start]): (int(start), int(end))
+        for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(names)])
+    }
+
+
+class HistoryStore:
+    """
+    Columnar copy of the consumption log's partitions for history queries.
+
+    Rows are sorted by (item, date) and written as one .npy file per column,
+    so each item is a contiguous slice; index.json maps item -> [start, end).
+    Columns are opened with mmap_mode="r", so a query only touches the pages
+    of its own rows. Date ranges are found with searchsorted inside the slice.
+
+    Each build goes into its own build-* directory and the CURRENT file
+    (replaced atomically) names the live one, so the columns and index a
+    reader maps always come from the same build. The build also records how
+    many bytes of each partition it covers. Rows appended after that are
+    read incrementally into memory and merged into query results, so a
+    logged event shows up at once; a full rebuild runs on a background
+    thread (queries keep using the previous build) only when compaction or
+    a rewrite changes the partitions, or HISTORY_REBUILD_PENDING_ROWS rows
+    have piled up. Only the very first build is done inline.
+
+    Only uncompacted partitions are covered: once compaction rolls a month
+    into the summaries, its rows drop out of the history. Rows without a
+    parseable date are left out too. Quantities come back as floats.
+    """
+
+    def __init__(self, source=consumption_store, store_dir: str = HISTORY_STORE_DIR):
+        self.source = source
+        self.store_dir = store_dir
+        self._columns: Dict[str, np.ndarray] = {}
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._build_name = None
+        self._build_source = None  # source signature the mapped build was made from
+        self._files: Dict[str, Tuple[int, bytes]] = {}  # partition -> (bytes covered, guard bytes)
+        self._pending: Dict[str, List[Dict[str, np.ndarray]]] = {}  # item -> appended row chunks
+        self._pending_rows = 0
+        self._signature = None  # source signature covered by the build plus pending rows
+        self._builder: Optional[Thread] = None
+        self._lock = Lock()
+
+    def _source_signature(self):
+        if not self.source.exists():
+            return None
+        partitions, summaries = self.source.signature(0)
+        # Lists, to compare equal to the copy stored in index.json
+        return [[list(entry) for entry in partitions], list(summaries) if summaries else None]
+
+    def _build(self, signature) -> str:
+        """Write a complete build and point CURRENT at it; returns its directory name"""
+        frames = []
+        files = {}
+        for path in self.source.partitions(0):
+            try:
+                with open(path, "rb") as f:
+                    data = _complete_lines(f.read())
+            except FileNotFoundError:
+                continue  # compacted away since it was listed
+            files[os.path.basename(path)] = [len(data), data[-_GUARD_BYTES:].hex()]
+            if data:
+                frames.append(pd.read_csv(io.BytesIO(data)))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+        names, arrays = _to_arrays(df)
+        index = {item: list(bounds) for item, bounds in _item_bounds(names).items()}
+
+        # Written under a temporary directory name and renamed when complete,
+        # so build-* directories are never partial
+        name = f"build-{time.time_ns()}-{os.getpid()}"
+        building = os.path.join(self.store_dir, f"tmp-{name}")
+        os.makedirs(building)
+        for column, values in arrays.items():
+            with open(os.path.join(building, f"{column}.npy"), "wb") as f:
+                np.save(f, values)
+        with open(os.path.join(building, "index.json"), "w") as f:
+            json.dump({"source": signature, "files": files, "items": index}, f)
+        os.rename(building, os.path.join(self.store_dir, name))
+
+        pointer = os.path.join(self.store_dir, "CURRENT")
+        with open(f"{pointer}.{os.getpid()}.tmp", "w") as f:
+            f.write(name)
+        os.replace(f"{pointer}.{os.getpid()}.tmp", pointer)
+        return name
+
+    def _remove_old_builds(self, current: str):
+        """Delete finished builds other than current; open maps of them stay valid on POSIX"""
+        for name in os.listdir(self.store_dir):
+            if name.startswith("build-") and name != current:
+                shutil.rmtree(os.path.join(self.store_dir, name), ignore_errors=True)
+
+    def _open(self):
+        """Map the build CURRENT names, unless it's already mapped or can't be read"""
+        try:
+            with open(os.path.join(self.store_dir, "CURRENT")) as f:
+                name = f.read().strip()
+            if name == self._build_name:
+                return
+            build_dir = os.path.join(self.store_dir, name)
+            with open(os.path.join(build_dir, "index.json")) as f:
+                meta = json.load(f)
+            index = {item: tuple(bounds) for item, bounds in meta["items"].items()}
+            files = {partition: (offset, bytes.fromhex(guard)) for partition, (offset, guard) in meta["files"].items()}
+            columns = {
+                column: np.load(os.path.join(build_dir, f"{column}.npy"), mmap_mode="r") if index else np.array([])
+                for column in _COLUMNS
+            }
+        except (OSError, ValueError, KeyError):
+            return  # no build yet, or it was replaced while being read
+        self._index, self._columns, self._files = index, columns, files
+        self._build_name = name
+        self._build_source = self._signature = meta["source"]
+        self._pending, self._pending_rows = {}, 0
+
+    def _load_appended(self, signature) -> bool:
+        """Read rows appended since the build into _pending; False if a rebuild is needed"""
+        if signature[1] != self._build_source[1]:
+            return False  # compaction changed the summaries
+        paths = self.source.partitions(0)
+        if any(partition not in map(os.path.basename, paths) for partition in self._files):
+            return False  # a partition was compacted away
+
+        frames = []
+        files = {}
+        try:
+            for path in paths:
+                partition = os.path.basename(path)
+                offset, guard = self._files.get(partition, (0, b""))
+                with open(path, "rb") as f:
+                    f.seek(offset - len(guard))
+                    if f.read(len(guard)) != guard:
+                        return False  # rewritten, not appended to
+                    chunk = _complete_lines(f.read())
+                files[partition] = (offset + len(chunk), (guard + chunk)[-_GUARD_BYTES:])
+                if chunk:
+                    header = 0 if offset == 0 else None
+                    frames.append(pd.read_csv(io.BytesIO(chunk), header=header, names=None if header == 0 else COLUMNS))
+        except FileNotFoundError:
+            return False
+
+        if frames:
+            names, arrays = _to_arrays(pd.concat(frames, ignore_index=True))
+            for item, (start, end) in _item_bounds(names).items():
+                self._pending.setdefault(item, []).append({column: arrays[column][start:end] for column in _COLUMNS})
+            self._pending_rows += len(names)
+        self._files = files
+        return True
+
+    def _rebuild(self, signature):
+        try:
+            name = self._build(signature)
+            with self._lock:
+                self._open()
+            self._remove_old_builds(name)
+        except Exception as e:
+            print(f"History store rebuild failed: {e}")
+
+    def refresh(self):
+        """
+        Pick up a newer build (possibly made by another process), read rows
+        appended since, and start a background rebuild if they can't be read
+        incrementally or too many have piled up
+        """
+        signature = self._source_signature()
+        with self._lock:
+            if signature is None or signature == self._signature:
+                return
+            self._open()
+            if signature == self._signature:
+                return
+            if self._build_name is None:
+                os.makedirs(self.store_dir, exist_ok=True)
+                self._build(signature)
+                self._open()
+                return
+            if self._load_appended(signature):
+                self._signature = signature
+                if self._pending_rows < HISTORY_REBUILD_PENDING_ROWS:
+                    return
+            if self._builder is None or not self._builder.is_alive():
+                self._builder = Thread(target=self._rebuild, args=(signature,), daemon=True)
+                self._builder.start()
+
+    def query(
+        self,
+        item_name: str,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Rows for one item between date_from and date_to (inclusive, YYYY-MM-DD),
+        oldest first, at most limit rows. None if the item has no history.
+        Includes rows appended since the build; after compaction or a
+        rewrite they may come from the previous build until the rebuild ends.
+        """
+        self.refresh()
+        with self._lock:
+            bounds = self._index.get(item_name)
+            columns = self._columns
+            pending = list(self._pending.get(item_name, ()))
+        if bounds is None and not pending:
+            return None
+
+        if bounds is None:
+            rows = {column: values[:0] for column, values in pending[0].items()}
+        else:
+            start, end = bounds
+            rows = {column: columns[column][start:end] for column in _COLUMNS}
+        if pending:
+            rows = {column: np.concatenate([rows[column]] + [chunk[column] for chunk in pending]) for column in _COLUMNS}
+            order = np.argsort(rows["dates"], kind="stable")
+            rows = {column: values[order] for column, values in rows.items()}
+
+        dates = rows["dates"]
+        low = np.searchsorted(dates, np.datetime64(date_from, "D"), side="left") if date_from else 0
+        high = np.searchsorted(dates, np.datetime64(date_to, "D"), side="right") if date_to else len(dates)
+        if limit is not None:
+            high = min(high, low + limit)
+        return {column: rows[column][low:high] for column in _COLUMNS}
+
+    def history(self, item_name: str, date_from=None, date_to=None, limit=None):
+        """The /item_history list of dicts, None if the item has no history"""
+        rows = self.query(item_name, date_from, date_to, limit)
+        return None if rows is None else self.to_records(rows)
+
+    @staticmethod
+    def to_records(rows: Dict[str, np.ndarray]):
+        """Row dicts for a query result, with dates formatted in one vectorized call"""
+        return [
+            {"date": date, "quantity_used": quantity_used, "remaining_stock": remaining_stock}
+            for date, quantity_used, remaining_stock in zip(
+                np.datetime_as_string(rows["dates"], unit="D").tolist(),
+                rows["quantity_used"].tolist(),
+                rows["remaining_stock"].tolist()
+            )
+        ]
+
+    def iter_ndjson(self, rows: Dict[str, np.ndarray], item_name: str) -> Iterator[bytes]:
+        """Newline-delimited JSON, EXPORT_CHUNK_ROWS rows per chunk"""
+        for offset in range(0, len(rows["dates"]), EXPORT_CHUNK_ROWS):
+            chunk = slice(offset, offset + EXPORT_CHUNK_ROWS)
+            lines = [
+                json.dumps({"item_name": item_name, "date": date, "quantity_used": quantity_used, "remaining_stock": remaining_stock})
+                for date, quantity_used, remaining_stock in zip(
+                    np.datetime_as_string(rows["dates"][chunk], unit="D").tolist(),
+                    rows["quantity_used"][chunk].tolist(),
+                    rows["remaining_stock"][chunk].tolist()
+                )
+            ]
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    def iter_arrow(self, rows: Dict[str, np.ndarray]) -> Iterator[bytes]:
+        """Arrow IPC stream, one record batch per EXPORT_CHUNK_ROWS rows. Needs pyarrow."""
+        if pa is None:
+            raise RuntimeError("Arrow export requires pyarrow")
+        schema = pa.schema([("date", pa.date32()), ("quantity_used", pa.float64()), ("remaining_stock", pa.float64())])
+        sink = _ChunkSink()
+        writer = pa.ipc.new_stream(sink, schema)
+        for offset in range(0, len(rows["dates"]), EXPORT_CHUNK_ROWS):
+            chunk = slice(offset, offset + EXPORT_CHUNK_ROWS)
+            writer.write_batch(pa.record_batch([
+                pa.array(np.asarray(rows["dates"][chunk])),
+                pa.array(np.asarray(rows["quantity_used"][chunk])),
+                pa.array(np.asarray(rows["remaining_stock"][chunk]))
+            ], schema=schema))
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back what was written since the last take()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+history_store = HistoryStore()
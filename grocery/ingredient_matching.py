@@ -0,0 +1,343 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Different names for the same ingredient, mapped to one canonical phrase
+SYNONYMS = {
+    "scallion": "green onion",
+    "spring onion": "green onion",
+    "cilantro": "coriander",
+    "garbanzo": "chickpea",
+    "garbanzo bean": "chickpea",
+    "capsicum": "bell pepper",
+    "aubergine": "eggplant",
+    "courgette": "zucchini",
+    "maize": "corn",
+    "prawn": "shrimp",
+    "bean curd": "tofu",
+    "curd": "yogurt",
+    "yoghurt": "yogurt",
+}
+# One pass, longest phrase first, so "bean curd" wins over "curd" and
+# "garbanzo bean" over "garbanzo"
+SYNONYM_PATTERN = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(SYNONYMS, key=len, reverse=True))) + r")\b"
+)
+
+# Words that describe an ingredient but don't identify it
+STOPWORDS = {"fresh", "large", "small", "medium", "of", "and", "or", "to", "taste", "a", "the", "some"}
+
+# Words that end in "s" but are not plurals
+NON_PLURALS = {"hummus", "asparagus", "couscous", "swiss", "molasses", "citrus", "lemongrass"}
+
+
+def singularize(word: str) -> str:
+    """Cheap English singular form, good enough for ingredient names"""
+    if len(word) <= 3 or word in NON_PLURALS or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes") or word.endswith(("ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _build_unit_table() -> Dict[str, Tuple[str, float]]:
+    """Every accepted spelling of a unit -> (canonical unit, factor to it)"""
+    base = {
+        "g": ("g", 1.0), "gram": ("g", 1.0), "gm": ("g", 1.0), "kg": ("g", 1000.0), "kilogram": ("g", 1000.0),
+        "mg": ("g", 0.001), "oz": ("g", 28.3495), "ounce": ("g", 28.3495), "lb": ("g", 453.592), "pound": ("g", 453.592),
+        "ml": ("ml", 1.0), "milliliter": ("ml", 1.0), "millilitre": ("ml", 1.0), "l": ("ml", 1000.0),
+        "liter": ("ml", 1000.0), "litre": ("ml", 1000.0), "dl": ("ml", 100.0), "cup": ("ml", 240.0),
+        "tbsp": ("ml", 15.0), "tablespoon": ("ml", 15.0), "tsp": ("ml", 5.0), "teaspoon": ("ml", 5.0),
+        "fl oz": ("ml", 29.5735), "pint": ("ml", 473.176), "quart": ("ml", 946.353),
+        "piece": ("count", 1.0), "pc": ("count", 1.0), "whole": ("count", 1.0), "clove": ("count", 1.0),
+        "slice": ("count", 1.0), "can": ("count", 1.0), "dozen": ("count", 12.0), "count": ("count", 1.0),
+    }
+    table = {}
+    for alias, conversion in base.items():
+        table[alias] = conversion
+        if len(alias) > 2:
+            table[alias + "s"] = conversion
+    table.update({"lbs": base["lb"], "pcs": base["pc"], "tbs": base["tbsp"]})
+    return table
+
+
+UNITS = _build_unit_table()
+# Recipe shorthand where case matters: "T" is a tablespoon, "t" a teaspoon
+CASE_SENSITIVE_UNITS = {"T": UNITS["tbsp"], "t": UNITS["tsp"]}
+
+UNICODE_FRACTIONS = {"½": " 1/2", "¼": " 1/4", "¾": " 3/4", "⅓": " 1/3", "⅔": " 2/3", "⅛": " 1/8"}
+QUANTITY_PATTERN = re.compile(r"^(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)(?:\s*(?:-|to)\s*\d+(?:\.\d+)?)?\s*")
+UNIT_PATTERN = re.compile(r"^(fl\.?\s*oz|[a-z]+)\.?(?:\s+|$)", re.IGNORECASE)
+PARENTHESES_PATTERN = re.compile(r"\([^)]*\)")
+
+
+class ParsedIngredient(NamedTuple):
+    quantity: Optional[float]  # None when the recipe gives no amount ("salt to taste")
+    unit: Optional[str]        # canonical unit: "g", "ml" or "count"
+    name: str                  # canonical name, see canonical_name()
+
+
+def _parse_quantity(text: str) -> float:
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            numerator, denominator = part.split("/")
+            total += float(numerator) / float(denominator) if float(denominator) else 0.0
+        else:
+            total += float(part)
+    return total
+
+
+def to_canonical(quantity: Optional[float], unit: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """Convert an inventory quantity to the canonical unit; unknown units count as pieces"""
+    if quantity is None:
+        return None, None
+    unit = (unit or "").strip().rstrip(".")
+    canonical, factor = CASE_SENSITIVE_UNITS.get(unit) or UNITS.get(unit.lower(), ("count", 1.0))
+    return float(quantity) * factor, canonical
+
+
+@lru_cache(maxsize=16384)
+def canonical_name(name: str) -> str:
+    """Lowercase, singularize, drop filler words and apply synonyms"""
+    words = [singularize(word) for word in TOKEN_PATTERN.findall(name.lower())]
+    phrase = " ".join(word for word in words if word not in STOPWORDS)
+    return SYNONYM_PATTERN.sub(lambda match: SYNONYMS[match.group(1)], phrase)
+
+
+@lru_cache(maxsize=16384)
+def normalize_tokens(name: str) -> FrozenSet[str]:
+    return frozenset(canonical_name(name).split())
+
+
+@lru_cache(maxsize=16384)
+def parse_ingredient(text: str) -> ParsedIngredient:
+    """
+    Parse a recipe line such as "2 cups rice", "500g flour" or
+    "1 1/2 onions, chopped" into (quantity, canonical unit, canonical name).
+    Preparation notes after a comma and anything in parentheses are dropped.
+    A line that is only an amount and a unit ("1 cup") has an empty name.
+    """
+    for fraction, replacement in UNICODE_FRACTIONS.items():
+        text = text.replace(fraction, replacement)
+    text = PARENTHESES_PATTERN.sub(" ", text).split(",")[0].strip()
+
+    quantity = unit = None
+    match = QUANTITY_PATTERN.match(text)
+    if match:
+        quantity = _parse_quantity(match.group(1))
+        text = text[match.end():]
+        unit_match = UNIT_PATTERN.match(text)
+        conversion = None
+        if unit_match:
+            alias = unit_match.group(1)
+            conversion = CASE_SENSITIVE_UNITS.get(alias) or UNITS.get(" ".join(alias.lower().replace(".", " ").split()))
+        if conversion:
+            if not text[unit_match.end():].strip():
+                return ParsedIngredient(None, None, "")
+            unit, factor = conversion
+            quantity *= factor
+            text = text[unit_match.end():]
+        else:
+            unit = "count"
+        if text.lower().startswith("of "):
+            text = text[3:]
+
+    return ParsedIngredient(quantity, unit, canonical_name(text) or text.strip().lower())
+
+
+def aggregate_ingredients(lines: Iterable[str]) -> Dict[str, ParsedIngredient]:
+    """
+    Parse recipe lines and sum the quantities of repeated ingredients, keyed by
+    canonical name in first-seen order. If the same ingredient appears with
+    amounts in different units (or without an amount), its quantity is unknown.
+    """
+    required: Dict[str, ParsedIngredient] = {}
+    for line in lines:
+        parsed = parse_ingredient(line)
+        if not parsed.name:
+            continue
+        previous = required.get(parsed.name)
+        if previous is None:
+            required[parsed.name] = parsed
+        elif previous.quantity is not None and parsed.quantity is not None and previous.unit == parsed.unit:
+            required[parsed.name] = parsed._replace(quantity=previous.quantity + parsed.quantity)
+        else:
+            required[parsed.name] = ParsedIngredient(None, None, parsed.name)
+    return required
+
+
+class InventoryMatcher:
+    """
+    Token index over inventory names. An ingredient is covered when some
+    inventory name's tokens are all in the ingredient ("rice" covers
+    "basmati rice") or the ingredient's tokens are all in an inventory name
+    ("tomato" is covered by "cherry tomatoes").
+
+    Each inventory name is also filed under its rarest token, so the first
+    check only looks at names whose rarest token is in the ingredient; the
+    second is an intersection of posting lists, smallest first.
+
+    Entries may carry a stock quantity, which shortfall() compares with
+    parsed recipe amounts in the same canonical unit.
+    """
+
+    def __init__(self, inventory_names: Iterable[str] = ()):
+        self._names: List[FrozenSet[str]] = []
+        self._labels: List[str] = []
+        self._stock: List[Dict[str, float]] = []
+        self._positions: Dict[FrozenSet[str], int] = {}
+        self._index: Dict[str, Set[int]] = {}
+        self._by_rarest: Optional[Dict[str, List[int]]] = None
+        for name in inventory_names:
+            self.add(name)
+
+    @classmethod
+    def from_items(cls, items: Iterable[Any]) -> "InventoryMatcher":
+        """Build from inventory items (dicts or InventoryItem models) with quantity and unit"""
+        matcher = cls()
+        for item in items:
+            if isinstance(item, dict):
+                matcher.add(item.get("item_name", ""), item.get("quantity"), item.get("unit"))
+            else:
+                matcher.add(item.item_name, getattr(item, "quantity", None), getattr(item, "unit", None))
+        return matcher
+
+    def add(self, name: str, quantity: Optional[float] = None, unit: Optional[str] = None):
+        tokens = normalize_tokens(name)
+        if not tokens:
+            return
+        position = self._positions.get(tokens)
+        if position is None:
+            position = len(self._names)
+            self._positions[tokens] = position
+            self._names.append(tokens)
+            self._labels.append(name)
+            self._stock.append({})
+            for token in tokens:
+                self._index.setdefault(token, set()).add(position)
+            self._by_rarest = None
+
+        amount, canonical = to_canonical(quantity, unit)
+        if amount is not None:
+            stock = self._stock[position]
+            stock[canonical] = stock.get(canonical, 0.0) + amount
+
+    def _rarest_index(self) -> Dict[str, List[int]]:
+        if self._by_rarest is None:
+            self._by_rarest = {}
+            for position, tokens in enumerate(self._names):
+                rarest = min(tokens, key=lambda token: len(self._index[token]))
+                self._by_rarest.setdefault(rarest, []).append(position)
+        return self._by_rarest
+
+    def _covering(self, tokens: FrozenSet[str], first_only: bool = False) -> Set[int]:
+        """Positions of inventory entries that cover an ingredient's tokens"""
+        found = set()
+        if not tokens:
+            return found
+
+        # Some inventory name is contained in the ingredient
+        by_rarest = self._rarest_index()
+        for token in tokens:
+            for position in by_rarest.get(token, ()):
+                if self._names[position] <= tokens:
+                    found.add(position)
+                    if first_only:
+                        return found
+
+        # The ingredient is contained in some inventory name
+        postings = [self._index.get(token) for token in tokens]
+        if not all(postings):
+            return found
+        postings.sort(key=len)
+        common = set(postings[0])
+        for posting in postings[1:]:
+            common &= posting
+            if not common:
+                break
+        return found | common
+
+    def matches(self, ingredient: str) -> bool:
+        return bool(self._covering(normalize_tokens(ingredient), first_only=True))
+
+    def lookup(self, ingredient: str) -> Optional[str]:
+        """Name (as added) of an inventory entry covering the ingredient, if any"""
+        positions = self._covering(normalize_tokens(ingredient), first_only=True)
+        return self._labels[min(positions)] if positions else None
+
+    def missing(self, ingredients: Iterable[str]) -> List[str]:
+        """Ingredients not covered by the inventory, in input order"""
+        return [ingredient for ingredient in ingredients if not self.matches(ingredient)]
+
+    def shortfall(self, required: Iterable[ParsedIngredient]) -> List[Dict[str, Any]]:
+        """
+        Ingredients the inventory has, but not enough of. Amounts are only
+        compared when both sides are known in the same canonical unit.
+
+        Each ingredient draws on its single best-stocked covering entry, and
+        what it uses is set aside, so overlapping entries aren't added up and
+        one entry's stock isn't counted for two ingredients.
+        """
+        remaining = [dict(stock) for stock in self._stock]
+        short = []
+        for ingredient in required:
+            if ingredient.quantity is None:
+                continue
+            positions = self._covering(normalize_tokens(ingredient.name))
+            stocked = [position for position in positions if ingredient.unit in remaining[position]]
+            if not stocked:
+                continue
+            best = max(stocked, key=lambda position: (remaining[position][ingredient.unit], -position))
+            available = remaining[best][ingredient.unit]
+            remaining[best][ingredient.unit] = max(0.0, available - ingredient.quantity)
+            if available < ingredient.quantity:
+                short.append({
+                    "item_name": ingredient.name,
+                    "required": round(ingredient.quantity, 2),
+                    "available": round(available, 2),
+                    "unit": ingredient.unit,
+                    "shortfall": round(ingredient.quantity - available, 2)
+                })
+        return short
+
+
+def benchmark_matching(inventory_size: int = 5000, ingredient_count: int = 100, runs: int = 5):
+    """Compare the token index with the old any(inv in ing or ing in inv) scan"""
+    import random
+    import time
+
+    rng = random.Random(0)
+    words = ["red", "green", "sweet", "wild", "brown", "baby", "smoked", "dried", "whole", "organic"]
+    foods = ["rice", "tomatoes", "onions", "eggs", "flour", "beans", "peppers", "carrots", "lentils", "apples"]
+    inventory = [f"{rng.choice(words)} {rng.choice(foods)} {i}" for i in range(inventory_size)]
+    ingredients = [f"{rng.randint(1, 5)} cups {rng.choice(words)} {rng.choice(foods)} {rng.randint(0, 2 * inventory_size)}" for _ in range(ingredient_count)]
+    inventory_items = {name.lower() for name in inventory}
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        naive = [ing for ing in ingredients if not any(inv in ing or ing in inv for inv in inventory_items)]
+    naive_time = (time.perf_counter() - start) / runs
+
+    build_time = query_time = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        matcher = InventoryMatcher(inventory)
+        matcher._rarest_index()
+        built = time.perf_counter()
+        indexed = matcher.missing(ingredients)
+        build_time += built - start
+        query_time += time.perf_counter() - built
+
+    print(f"substring scan: {naive_time * 1000:.2f} ms, {len(naive)} missing")
+    print(f"token index: build {build_time / runs * 1000:.2f} ms, match {query_time / runs * 1000:.2f} ms, {len(indexed)} missing")
+
+
+if __name__ == "__main__":
+    benchmark_matching()
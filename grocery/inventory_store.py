@@ -0,0 +1,144 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Any
+
+# Number of inventory versions kept in memory per worker
+MAX_INVENTORY_VERSIONS = 8
+# Versions are also written here so every worker process can serve them
+INVENTORY_STORE_DIR = os.environ.get("INVENTORY_STORE_DIR", "data/inventory_versions")
+MAX_STORED_VERSIONS = 64
+
+# Versions are hex digests from the backend; anything else is kept in memory only
+_VERSION_PATTERN = re.compile(r"^[0-9a-f]{1,64}$")
+
+
+class UnknownInventoryVersion(Exception):
+    """Raised when a request references an inventory version this worker has not seen"""
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+class InventoryStore:
+    """
+    Keeps the last few inventories sent by the backend, keyed by version, so
+    callers can send just a version (or a delta against one) instead of the
+    whole inventory on every planner call.
+
+    Versions are cached in memory and written to store_dir, so with several
+    worker processes a version pushed to one worker can be served by the
+    others instead of answering 409. Callers get copies, never the stored lists.
+    """
+
+    def __init__(self, max_versions: int = MAX_INVENTORY_VERSIONS, store_dir: Optional[str] = INVENTORY_STORE_DIR,
+                 max_stored_versions: int = MAX_STORED_VERSIONS):
+        self.max_versions = max_versions
+        self.store_dir = store_dir
+        self.max_stored_versions = max_stored_versions
+        self._versions: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = Lock()
+
+    def _path(self, version: str) -> Optional[str]:
+        if not self.store_dir or not _VERSION_PATTERN.match(version):
+            return None
+        return os.path.join(self.store_dir, f"{version}.json")
+
+    def _remember(self, version: str, inventory: List[Dict[str, Any]]):
+        with self._lock:
+            self._versions[version] = inventory
+            self._versions.move_to_end(version)
+            while len(self._versions) > self.max_versions:
+                self._versions.popitem(last=False)
+
+    def get(self, version: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            inventory = self._versions.get(version)
+            if inventory is not None:
+                self._versions.move_to_end(version)
+        if inventory is None:
+            path = self._path(version)
+            try:
+                with open(path) as f:
+                    inventory = json.load(f)
+            except (TypeError, OSError, ValueError):
+                raise UnknownInventoryVersion(version)
+            self._remember(version, inventory)
+        return [dict(item) for item in inventory]
+
+    def put(self, version: str, inventory: List[Dict[str, Any]]):
+        inventory = [dict(item) for item in inventory]
+        self._remember(version, inventory)
+        path = self._path(version)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            # Written under a per-process name and renamed, so other workers never read a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(inventory, f)
+            os.replace(tmp_path, path)
+            self._prune()
+        except OSError as e:
+            print(f"Error storing inventory version {version}: {e}")
+
+    def _prune(self):
+        """Drop the oldest stored versions beyond max_stored_versions"""
+        paths = [os.path.join(self.store_dir, name) for name in os.listdir(self.store_dir) if name.endswith(".json")]
+        if len(paths) <= self.max_stored_versions:
+            return
+        paths.sort(key=_mtime)
+        for path in paths[:-self.max_stored_versions]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Another worker pruned it first
+
+    def apply_delta(self, base_version: str, delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Build a new inventory from a stored base and an upserted/removed delta"""
+        base = self.get(base_version)
+        removed = {name.lower() for name in delta.get("removed", [])}
+        upserted = {item["item_name"].lower(): item for item in delta.get("upserted", [])}
+
+        inventory = []
+        for item in base:
+            key = item["item_name"].lower()
+            if key in removed:
+                continue
+            inventory.append(upserted.pop(key, item))
+        inventory.extend(upserted.values())
+        return inventory
+
+    def resolve(
+        self,
+        inventory: Optional[List[Dict[str, Any]]] = None,
+        inventory_version: Optional[str] = None,
+        base_version: Optional[str] = None,
+        inventory_delta: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the inventory for a request:
+        - full inventory (optionally tagged with a version, which is remembered)
+        - version only, served from memory
+        - delta against base_version, stored under the new version
+        Raises UnknownInventoryVersion when the referenced version is not held.
+        """
+        if inventory_delta is not None and base_version:
+            inventory = self.apply_delta(base_version, inventory_delta)
+        elif inventory is None and inventory_version:
+            return self.get(inventory_version)
+
+        inventory = inventory or []
+        if inventory_version:
+            self.put(inventory_version, inventory)
+        return [dict(item) for item in inventory]
+
+
+inventory_store = InventoryStore()
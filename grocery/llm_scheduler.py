@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# Priority classes, lower runs first
+INTERACTIVE = 0  # user-facing calls: /suggest_similar_products/, /generate_meal_plan/
+BULK = 1         # fan-out work inside a request, e.g. complementary shopping suggestions
+BACKGROUND = 2   # cache warmup
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_BURST = int(os.environ.get("LLM_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = 1.0
+LLM_BACKOFF_CAP_SECONDS = 30.0
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    True for 429 / rate limit errors from the OpenAI client, or for errors
+    raised from one (checked along the __cause__ / __context__ chain)
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if type(error).__name__ == "RateLimitError":
+            return True
+        status_code = getattr(error, "status_code", None)
+        if status_code is None:
+            status_code = getattr(getattr(error, "response", None), "status_code", None)
+        if status_code == 429:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class LLMScheduler:
+    """
+    Central gate for outbound LLM calls.
+
+    Calls wait in a priority queue and are released when both a token-bucket
+    token (LLM_REQUESTS_PER_MINUTE, bursting to LLM_BURST) and a concurrency
+    slot (LLM_MAX_CONCURRENCY) are free, highest priority first, so bulk and
+    background work can't starve interactive requests. Throttled calls are
+    retried with full-jitter exponential backoff.
+
+    Calls are blocking functions run on a worker thread. A caller that is
+    cancelled (deadline, client disconnect) gets control back at once, but
+    the slot stays taken until the thread finishes, so no more than
+    max_concurrency calls are ever really in flight.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        burst: int = LLM_BURST,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES
+    ):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._timer = None
+        self.completed = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.throttled_retries = 0
+        self.total_wait_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        self._refill()
+        while self._waiters and self._in_flight < self.max_concurrency and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # cancelled while queued
+                continue
+            self._tokens -= 1
+            self._in_flight += 1
+            future.set_result(None)
+
+        # Out of tokens with callers waiting: wake up when the next token is due
+        if self._waiters and self._in_flight < self.max_concurrency and self._timer is None:
+            delay = (1 - self._tokens) / self.rate if self.rate > 0 else 1.0
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    async def _acquire(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # slot was granted just as we were cancelled
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    async def run(self, call: Callable[[], T], priority: int = INTERACTIVE) -> T:
+        """Run the blocking call() on a worker thread under the rate limit and concurrency cap, retrying throttled calls"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.monotonic()
+            await self._acquire(priority)
+            self.total_wait_seconds += time.monotonic() - queued_at
+            work = loop.run_in_executor(None, call)
+            # The slot is freed when the thread is done, not when the caller stops waiting
+            work.add_done_callback(lambda _: self._release())
+            try:
+                result = await asyncio.shield(work)
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                self.completed[name] = self.completed.get(name, 0) + 1
+                return result
+            except asyncio.CancelledError:
+                # Retrieve the abandoned call's outcome so it isn't reported as never retrieved
+                work.add_done_callback(lambda future: future.cancelled() or future.exception())
+                raise
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == self.max_retries:
+                    raise
+                self.throttled_retries += 1
+                # Stop handing out tokens that would only be throttled again
+                self._tokens = min(self._tokens, 0.0)
+            delay = random.uniform(0, min(LLM_BACKOFF_CAP_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        self._refill()
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+        return {
+            "queue_depth": depth,
+            "in_flight": self._in_flight,
+            "tokens_available": round(self._tokens, 2),
+            "completed": dict(self.completed),
+            "throttled_retries": self.throttled_retries,
+            "total_wait_seconds": round(self.total_wait_seconds, 3)
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, Depends, Body
+from fastapi import FastAPI, HTTPException, Depends, Body, Query
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import pandas as pd
@@ -16,6 +17,19 @@ from moya.orchestrators.simple_orchestrator import SimpleOrchestrator
 from moya.agents.azure_openai_agent import AzureOpenAIAgent, AzureOpenAIAgentConfig
 from moya.conversation.message import Message
 from mealplanningagent import register_meal_planning_endpoints, get_meal_planning_orchestrator, MealPlanRequest, generate_meal_plan,load_previous_meal_plans
+from inventory_store import inventory_store, UnknownInventoryVersion
+from conversation_memory import conversation_memory, SWEEP_INTERVAL_SECONDS
+from disconnect_middleware import CancelOnDisconnectMiddleware
+from consumption_store import consumption_store, COLUMNS as CONSUMPTION_COLUMNS, COMPACTION_INTERVAL_SECONDS
+from models.predictor import consumption_predictor
+from history_store import history_store, ARROW_AVAILABLE
+from models.parallel_forecast import shutdown_pool as shutdown_forecast_pool
+from copurchase_index import copurchase_index
+from recommendation_cache import recommendation_cache
+from llm_scheduler import llm_scheduler, INTERACTIVE, BULK, BACKGROUND
+from deadlines import DeadlineMiddleware, remaining, mark_degraded, is_degraded
+from ingredient_matching import InventoryMatcher, aggregate_ingredients
+from shopping_list import assemble_shopping_list
 
 app = FastAPI(title="Smart Kitchen Inventory API")
 
@@ -31,32 +45,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-CSV_FILE = "data/consumption_log.csv"
+# Cancel in-flight handlers (and the AI work they await) when the client goes away
+app.add_middleware(CancelOnDisconnectMiddleware)
+# Per-request LLM deadlines from the X-Deadline-Ms header, X-Degraded on fallback responses
+app.add_middleware(DeadlineMiddleware)
 
 # Ensure data directory exists
 os.makedirs("data", exist_ok=True)
 
-# Initialize CSV with sample data if it doesn't exist
-if not os.path.exists(CSV_FILE):
-    sample_data = pd.DataFrame([
-        {"item_name": "Milk", "date_consumed": "2025-03-01", "quantity_used": 1, "remaining_stock": 5},
-        {"item_name": "Milk", "date_consumed": "2025-03-05", "quantity_used": 1, "remaining_stock": 4},
-        {"item_name": "Milk", "date_consumed": "2025-03-10", "quantity_used": 1, "remaining_stock": 3},
-        {"item_name": "Eggs", "date_consumed": "2025-03-02", "quantity_used": 6, "remaining_stock": 12},
-        {"item_name": "Eggs", "date_consumed": "2025-03-06", "quantity_used": 6, "remaining_stock": 6},
-        {"item_name": "Eggs", "date_consumed": "2025-03-09", "quantity_used": 6, "remaining_stock": 0},
-        {"item_name": "Rice", "date_consumed": "2025-03-03", "quantity_used": 500, "remaining_stock": 5000},
-        {"item_name": "Rice", "date_consumed": "2025-03-08", "quantity_used": 500, "remaining_stock": 4500},
-        {"item_name": "Rice", "date_consumed": "2025-03-13", "quantity_used": 500, "remaining_stock": 4000},
-        {"item_name": "Tomatoes", "date_consumed": "2025-03-04", "quantity_used": 3, "remaining_stock": 10},
-        {"item_name": "Tomatoes", "date_consumed": "2025-03-07", "quantity_used": 3, "remaining_stock": 7},
-        {"item_name": "Tomatoes", "date_consumed": "2025-03-11", "quantity_used": 3, "remaining_stock": 4},
-        {"item_name": "Bread", "date_consumed": "2025-03-05", "quantity_used": 1, "remaining_stock": 3},
-        {"item_name": "Bread", "date_consumed": "2025-03-08", "quantity_used": 1, "remaining_stock": 2},
-        {"item_name": "Bread", "date_consumed": "2025-03-12", "quantity_used": 1, "remaining_stock": 1},
-    ])
-    sample_data.to_csv(CSV_FILE, index=False)
+# Initialize the consumption log with sample data if it doesn't exist
+# (seed() checks and writes under the store's lock, so only one worker does it)
+consumption_store.seed([
+    {"item_name": "Milk", "date_consumed": "2025-03-01", "quantity_used": 1, "remaining_stock": 5},
+    {"item_name": "Milk", "date_consumed": "2025-03-05", "quantity_used": 1, "remaining_stock": 4},
+    {"item_name": "Milk", "date_consumed": "2025-03-10", "quantity_used": 1, "remaining_stock": 3},
+    {"item_name": "Eggs", "date_consumed": "2025-03-02", "quantity_used": 6, "remaining_stock": 12},
+    {"item_name": "Eggs", "date_consumed": "2025-03-06", "quantity_used": 6, "remaining_stock": 6},
+    {"item_name": "Eggs", "date_consumed": "2025-03-09", "quantity_used": 6, "remaining_stock": 0},
+    {"item_name": "Rice", "date_consumed": "2025-03-03", "quantity_used": 500, "remaining_stock": 5000},
+    {"item_name": "Rice", "date_consumed": "2025-03-08", "quantity_used": 500, "remaining_stock": 4500},
+    {"item_name": "Rice", "date_consumed": "2025-03-13", "quantity_used": 500, "remaining_stock": 4000},
+    {"item_name": "Tomatoes", "date_consumed": "2025-03-04", "quantity_used": 3, "remaining_stock": 10},
+    {"item_name": "Tomatoes", "date_consumed": "2025-03-07", "quantity_used": 3, "remaining_stock": 7},
+    {"item_name": "Tomatoes", "date_consumed": "2025-03-11", "quantity_used": 3, "remaining_stock": 4},
+    {"item_name": "Bread", "date_consumed": "2025-03-05", "quantity_used": 1, "remaining_stock": 3},
+    {"item_name": "Bread", "date_consumed": "2025-03-08", "quantity_used": 1, "remaining_stock": 2},
+    {"item_name": "Bread", "date_consumed": "2025-03-12", "quantity_used": 1, "remaining_stock": 1},
+])
 
 
 class ConsumptionLog(BaseModel):
@@ -85,26 +100,17 @@ class ShoppingListResponse(BaseModel):
 class SimilarProductsResponse(BaseModel):
     item_name: str
     similar_products: List[str]
+    degraded: bool = False
 
 
 def load_data():
-    """ Load consumption data """
+    """ Load consumption data from the partitions in the lookback window """
     try:
-        return pd.read_csv(CSV_FILE, parse_dates=["date_consumed"])
+        return consumption_store.read(parse_dates=True)
     except Exception as e:
         print(f"Error loading data: {e}")
         # Return empty DataFrame with correct columns
-        return pd.DataFrame(columns=["item_name", "date_consumed", "quantity_used", "remaining_stock"])
-
-
-def save_data(df):
-    """ Save updated data """
-    try:
-        df.to_csv(CSV_FILE, index=False)
-        return True
-    except Exception as e:
-        print(f"Error saving data: {e}")
-        return False
+        return pd.DataFrame(columns=CONSUMPTION_COLUMNS)
 def get_ai_orchestrator():
     """Get or create AI orchestrator singleton"""
     if not hasattr(get_ai_orchestrator, "instance") or get_ai_orchestrator.instance is None:
@@ -163,19 +169,66 @@ def get_ai_orchestrator():
     
     return get_ai_orchestrator.instance
 
-async def get_similar_products(item_name: str) -> List[str]:
-    """Get similar product recommendations from AI"""
+# Share of the 3 recommendations taken from the local co-purchase index (0 = LLM only,
+# 1 = local only when the index knows enough related items)
+RECOMMENDATION_LOCAL_WEIGHT = float(os.environ.get("RECOMMENDATION_LOCAL_WEIGHT", "1.0"))
+MAX_RECOMMENDATIONS = 3
+# Longest an LLM recommendation may take before falling back (capped by X-Deadline-Ms)
+RECOMMENDATION_DEADLINE_SECONDS = float(os.environ.get("RECOMMENDATION_DEADLINE_SECONDS", "15"))
+
+
+async def get_similar_products(item_name: str, priority: int = INTERACTIVE) -> List[str]:
+    """
+    Get similar product recommendations, answering from the local co-purchase
+    index when possible and using the LLM for cold items or to fill the blend
+    """
+    local_count = round(MAX_RECOMMENDATIONS * min(max(RECOMMENDATION_LOCAL_WEIGHT, 0.0), 1.0))
+    try:
+        # The index may rebuild after a log write, so it runs off the event loop
+        local = await asyncio.to_thread(copurchase_index.similar, item_name) if local_count else []
+    except Exception as e:
+        print(f"Error reading co-purchase index for {item_name}: {e}")
+        local = []
+    
+    if local_count == MAX_RECOMMENDATIONS and len(local) >= MAX_RECOMMENDATIONS:
+        return local[:MAX_RECOMMENDATIONS]
+    
+    llm = await get_llm_similar_products(item_name, priority)
+    
+    # Local picks first (up to the blend share), then LLM picks, then any remaining local ones
+    merged = []
+    for product in local[:local_count] + llm + local[local_count:]:
+        if product.lower() not in {p.lower() for p in merged} and product.lower() != item_name.lower():
+            merged.append(product)
+    return merged[:MAX_RECOMMENDATIONS]
+
+
+async def get_llm_similar_products(item_name: str, priority: int = INTERACTIVE) -> List[str]:
+    """
+    Get similar product recommendations from AI, served from the cache when warm.
+    The LLM call goes through the shared scheduler at the given priority class
+    and is bounded by the request deadline; past it, the last cached or
+    co-purchase recommendations are returned and the response marked degraded.
+    """
+    cached = recommendation_cache.get(item_name)
+    if cached is not None:
+        return cached
+    
     orchestrator = get_ai_orchestrator()
     
     if not orchestrator:
         print(f"Warning: AI orchestrator not available for recommendations for {item_name}")
         return []
     
+    thread_id = f"recommendation_{item_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
     try:
         prompt = f"Suggest 2-3 similar products or complementary items for {item_name} that people often buy together. Only list the item names, separated by commas."
-        response = orchestrator.orchestrate(
-            thread_id=f"recommendation_{item_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-            user_message=prompt
+        response = await asyncio.wait_for(
+            llm_scheduler.run(
+                lambda: orchestrator.orchestrate(thread_id=thread_id, user_message=prompt),
+                priority
+            ),
+            timeout=remaining(RECOMMENDATION_DEADLINE_SECONDS)
         )
         
         # Clean and process the response
@@ -184,10 +237,19 @@ async def get_similar_products(item_name: str) -> List[str]:
             
         # Extract product names from the response
         similar_products = [product.strip() for product in response.split(',')]
-        return similar_products[:3]  # Limit to maximum 3 recommendations
+        similar_products = similar_products[:3]  # Limit to maximum 3 recommendations
+        recommendation_cache.set(item_name, similar_products)
+        return similar_products
+    except asyncio.TimeoutError:
+        print(f"Recommendation deadline exceeded for {item_name}, using fallback")
+        mark_degraded()
+        return recommendation_cache.get_stale(item_name) or await asyncio.to_thread(copurchase_index.similar, item_name)
     except Exception as e:
         print(f"Error getting recommendations for {item_name}: {e}")
         return []
+    finally:
+        # One-shot thread: don't keep its conversation around
+        conversation_memory.release(thread_id)
 
 
 @app.post("/log_consumption/", response_model=dict)
@@ -201,15 +263,14 @@ async def log_consumption(entry: ConsumptionLog):
          -d '{"item_name":"Milk", "quantity_used":1, "remaining_stock":2}'
     """
     try:
-        df = load_data()
         new_entry = {
             "item_name": entry.item_name,
             "date_consumed": datetime.now().strftime("%Y-%m-%d"),
             "quantity_used": entry.quantity_used,
             "remaining_stock": entry.remaining_stock,
         }
-        df = pd.concat([df, pd.DataFrame([new_entry])], ignore_index=True)
-        save_data(df)
+        # Appended to this month's partition instead of rewriting the whole log
+        consumption_store.append([new_entry])
         return {"status": "success", "message": "Consumption logged successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error logging consumption: {str(e)}")
@@ -224,44 +285,9 @@ async def predict_consumption(item_name: str):
     curl -X GET "http://localhost:8000/predict/Milk"
     """
     try:
-        df = load_data()
-        df = df[df["item_name"] == item_name]
-
-        if len(df) < 3:
-            raise HTTPException(status_code=400, detail="Not enough data for prediction")
-
-        df["date_consumed"] = pd.to_datetime(df["date_consumed"], format="%Y-%m-%d", errors='coerce')
-        df = df.sort_values("date_consumed")
-
-        # Calculate average consumption rate
-        df["date_diff"] = df["date_consumed"].diff().dt.days
-        df["date_diff"] = df["date_diff"].replace(0, 1).fillna(1)  # Avoid division by zero
-        df["daily_usage"] = df["quantity_used"] / df["date_diff"]
-
-        # Remove invalid values
-        df["daily_usage"] = df["daily_usage"].replace([float('inf'), -float('inf')], None).dropna()
-
-        if df["daily_usage"].isna().all():
-            raise HTTPException(status_code=400, detail="Invalid data: Unable to compute usage rate")
-
-        avg_daily_usage = df["daily_usage"].mean()
-        remaining_stock = df.iloc[-1]["remaining_stock"]
-
-        if avg_daily_usage <= 0 or remaining_stock <= 0:
-            raise HTTPException(status_code=400, detail="Invalid consumption data")
-
-        days_until_empty = remaining_stock / avg_daily_usage
-        refill_date = datetime.now() + timedelta(days=days_until_empty)
-
-        return {
-            "status": "success", 
-            "item_name": item_name,
-            "prediction": f"Refill needed by {refill_date.strftime('%Y-%m-%d')}",
-            "days_until_empty": round(days_until_empty, 1),
-            "refill_date": refill_date.strftime('%Y-%m-%d')
-        }
-    except HTTPException as he:
-        raise he
+        return consumption_predictor.predict(item_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error predicting consumption: {str(e)}")
 
@@ -275,50 +301,21 @@ async def predict_expiry():
     curl -X GET "http://localhost:8000/predict_expiry/"
     """
     try:
-        df = load_data()
-        df["date_consumed"] = pd.to_datetime(df["date_consumed"], format="%Y-%m-%d", errors='coerce')
-        df = df.sort_values(["item_name", "date_consumed"])
-
-        soonest_item = None
-        soonest_date = None
-        days_left = None
-
-        for item_name, group in df.groupby("item_name"):
-            if len(group) < 3:
-                continue  # Skip items with insufficient data
-
-            group["date_diff"] = group["date_consumed"].diff().dt.days
-            group["date_diff"] = group["date_diff"].replace(0, 1).fillna(1)
-            group["daily_usage"] = group["quantity_used"] / group["date_diff"]
-
-            # Remove invalid values
-            group["daily_usage"] = group["daily_usage"].replace([float('inf'), -float('inf')], None).dropna()
-            if group["daily_usage"].isna().all():
-                continue
-
-            avg_daily_usage = group["daily_usage"].mean()
-            remaining_stock = group.iloc[-1]["remaining_stock"]
-
-            if avg_daily_usage <= 0 or remaining_stock <= 0:
-                continue  # Skip items with invalid data
+        # Same cached forecaster as /predict (summaries included), off the event loop
+        predictions = await asyncio.to_thread(consumption_predictor.predict_many)
 
-            days_until_empty = remaining_stock / avg_daily_usage
-            expiry_date = datetime.now() + timedelta(days=days_until_empty)
-
-            if soonest_date is None or expiry_date < soonest_date:
-                soonest_date = expiry_date
-                soonest_item = item_name
-                days_left = days_until_empty
-
-        if soonest_item is None:
+        # Items with insufficient or invalid data come back as errors and are skipped
+        valid = [prediction for prediction in predictions.values() if prediction["status"] == "success"]
+        if not valid:
             raise HTTPException(status_code=400, detail="No valid expiry predictions available")
 
+        soonest = min(valid, key=lambda prediction: prediction["days_until_empty"])
         return {
             "status": "success",
-            "soonest_expiry": f"{soonest_item} will run out by {soonest_date.strftime('%Y-%m-%d')}",
-            "item_name": soonest_item,
-            "days_left": round(days_left, 1),
-            "expiry_date": soonest_date.strftime('%Y-%m-%d')
+            "soonest_expiry": f"{soonest['item_name']} will run out by {soonest['refill_date']}",
+            "item_name": soonest["item_name"],
+            "days_left": soonest["days_until_empty"],
+            "expiry_date": soonest["refill_date"]
         }
     except HTTPException as he:
         raise he
@@ -341,7 +338,7 @@ async def suggest_for_shopping_list(shopping_list: List[str]):
         
         # Create tasks for each item in the shopping list
         for item in shopping_list:
-            task = get_similar_products(item)
+            task = get_similar_products(item, BULK)
             recommendation_tasks.append((item, task))
         
         # Wait for all recommendation tasks to complete
@@ -374,7 +371,8 @@ async def suggest_similar_products(request: SimilarProductsRequest):
         similar_products = await get_similar_products(request.item_name)
         return SimilarProductsResponse(
             item_name=request.item_name,
-            similar_products=similar_products
+            similar_products=similar_products,
+            degraded=is_degraded()
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error suggesting similar products: {str(e)}")
@@ -388,47 +386,19 @@ async def smart_shopping_list():
     curl -X GET "http://localhost:8000/smart_shopping_list/"
     """
     try:
-        df = load_data()
-        df["date_consumed"] = pd.to_datetime(df["date_consumed"], errors='coerce')
-        df = df.sort_values(["item_name", "date_consumed"])
-
         shopping_list = []
         recommendation_tasks = []
-        items_to_recommend = []
-
-        # First pass: Calculate consumption metrics and identify items running low
-        for item_name, group in df.groupby("item_name"):
-            if len(group) < 3:
-                continue
-
-            group["date_diff"] = group["date_consumed"].diff().dt.days
-            group["date_diff"] = group["date_diff"].replace(0, 1).fillna(1)
-            group["daily_usage"] = group["quantity_used"] / group["date_diff"]
 
-            group["daily_usage"] = group["daily_usage"].replace([float('inf'), -float('inf')], None).dropna()
-            if group["daily_usage"].isna().all():
-                continue
-
-            avg_daily_usage = group["daily_usage"].mean()
-            remaining_stock = group.iloc[-1]["remaining_stock"]
-
-            if avg_daily_usage <= 0 or remaining_stock <= 0:
-                continue
-
-            days_until_empty = remaining_stock / avg_daily_usage
-            expiry_date = datetime.now() + timedelta(days=days_until_empty)
-
-            if days_until_empty < 5:
-                items_to_recommend.append(item_name)
-                
-                shopping_list.append({
-                    "item_name": item_name,
-                    "refill_by": expiry_date.strftime('%Y-%m-%d'),
-                    "remaining_stock": remaining_stock,
-                    "daily_usage": round(avg_daily_usage, 2),
-                    "days_left": round(days_until_empty, 1),
-                    "suggested_similar_items": []  # Will be filled later
-                })
+        # First pass: items the forecaster (same as /predict) says run out within 5 days
+        for prediction in await asyncio.to_thread(consumption_predictor.low_stock, 5):
+            shopping_list.append({
+                "item_name": prediction["item_name"],
+                "refill_by": prediction["refill_date"],
+                "remaining_stock": prediction["remaining_stock"],
+                "daily_usage": prediction["daily_usage"],
+                "days_left": prediction["days_until_empty"],
+                "suggested_similar_items": []  # Will be filled later
+            })
 
         # Sort by urgency (lowest days_left first) and take top 5
         shopping_list = sorted(shopping_list, key=lambda x: x["days_left"])[:5]
@@ -438,7 +408,7 @@ async def smart_shopping_list():
             
         # Second pass: Get recommendations for all items in parallel
         for item in shopping_list:
-            task = get_similar_products(item["item_name"])
+            task = get_similar_products(item["item_name"], BULK)
             recommendation_tasks.append((item["item_name"], task))
             
         # Wait for all recommendation tasks and update shopping list items
@@ -478,40 +448,116 @@ async def get_all_items():
         raise HTTPException(status_code=500, detail=f"Error retrieving items: {str(e)}")
 
 
-@app.get("/item_history/{item_name}", response_model=dict)
-async def get_item_history(item_name: str):
+@app.get("/item_history/{item_name}")
+async def get_item_history(
+    item_name: str,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1),
+    format: str = Query("json", pattern="^(json|ndjson|arrow)$")
+):
     """
-    Get consumption history for a specific item
+    Get consumption history for a specific item, oldest first.
+    "from"/"to" (YYYY-MM-DD, inclusive) and "limit" narrow the range;
+    format=ndjson or format=arrow streams the rows for bulk export.
+    Only uncompacted months are included, and quantities are floats.
     
     Example curl:
     curl -X GET "http://localhost:8000/item_history/Milk"
+    curl -X GET "http://localhost:8000/item_history/Milk?from=2025-03-01&to=2025-03-31&limit=100"
+    curl -X GET "http://localhost:8000/item_history/Milk?format=ndjson"
     """
     try:
-        df = load_data()
-        item_data = df[df["item_name"] == item_name].sort_values("date_consumed")
+        rows = await asyncio.to_thread(history_store.query, item_name, date_from, date_to, limit)
         
-        if item_data.empty:
+        if rows is None:
             raise HTTPException(status_code=404, detail=f"No data found for item: {item_name}")
-            
-        history = []
-        for _, row in item_data.iterrows():
-            history.append({
-                "date": pd.to_datetime(row["date_consumed"]).strftime("%Y-%m-%d"),
-                "quantity_used": row["quantity_used"],
-                "remaining_stock": row["remaining_stock"]
-            })
-            
+        
+        if format == "ndjson":
+            return StreamingResponse(history_store.iter_ndjson(rows, item_name), media_type="application/x-ndjson")
+        if format == "arrow":
+            if not ARROW_AVAILABLE:
+                raise HTTPException(status_code=400, detail="Arrow export requires pyarrow")
+            return StreamingResponse(history_store.iter_arrow(rows), media_type="application/vnd.apache.arrow.stream")
+        
         return {
             "status": "success", 
             "item_name": item_name,
-            "history": history
+            "history": history_store.to_records(rows)
         }
     except HTTPException as he:
         raise he
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date range: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving item history: {str(e)}")
 
 
+# Background recommendation warmup
+WARMUP_INTERVAL_SECONDS = float(os.environ.get("RECOMMENDATION_WARMUP_INTERVAL_SECONDS", str(6 * 3600)))
+WARMUP_CONCURRENCY = int(os.environ.get("RECOMMENDATION_WARMUP_CONCURRENCY", "2"))
+WARMUP_LOW_STOCK_DAYS = float(os.environ.get("RECOMMENDATION_WARMUP_LOW_STOCK_DAYS", "7"))
+
+
+async def warm_recommendation_cache():
+    """
+    Precompute LLM recommendations for every tracked item and items predicted
+    to run low, at most WARMUP_CONCURRENCY at a time so interactive requests
+    keep most of the capacity. Items with a fresh cache entry are skipped.
+    """
+    # File reads and the predictor refresh run off the event loop
+    df = await asyncio.to_thread(load_data)
+    low_stock = await asyncio.to_thread(consumption_predictor.low_stock, WARMUP_LOW_STOCK_DAYS)
+    items = [item["item_name"] for item in low_stock]
+    items += [item for item in df["item_name"].dropna().unique().tolist() if item not in items]
+    
+    semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
+    
+    async def warm(item_name):
+        async with semaphore:
+            if not recommendation_cache.contains_fresh(item_name):
+                await get_llm_similar_products(item_name, BACKGROUND)
+    
+    await asyncio.gather(*(warm(item_name) for item_name in items))
+    print(f"Recommendation warmup finished for {len(items)} items")
+
+
+async def recommendation_warmup_loop():
+    """Run the warmup right after startup and then every WARMUP_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await warm_recommendation_cache()
+        except Exception as e:
+            print(f"Recommendation warmup failed: {e}")
+        await asyncio.sleep(WARMUP_INTERVAL_SECONDS)
+
+
+async def conversation_sweep_loop():
+    """Bound conversation memory every SWEEP_INTERVAL_SECONDS, including threads the agents wrote directly"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            conversation_memory.sweep()
+        except Exception as e:
+            print(f"Conversation memory sweep failed: {e}")
+
+
+async def compaction_loop():
+    """
+    Roll partitions older than the lookback window into the summaries right
+    after startup and then every COMPACTION_INTERVAL_SECONDS. The store's
+    file lock makes this safe with several workers doing the same.
+    """
+    while True:
+        try:
+            result = await asyncio.to_thread(consumption_store.compact)
+            if result:
+                print(f"Compacted consumption log into {result}")
+        except Exception as e:
+            print(f"Consumption log compaction failed: {e}")
+        await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the AI agent on startup"""
@@ -528,6 +574,26 @@ async def startup_event():
         print("Meal planning AI engine initialized successfully")
     else:
         print("Warning: Meal planning AI engine initialization failed")
+    
+    # Start filling the recommendation cache in the background
+    if orchestrator and WARMUP_INTERVAL_SECONDS > 0:
+        app.state.warmup_task = asyncio.create_task(recommendation_warmup_loop())
+
+    if SWEEP_INTERVAL_SECONDS > 0:
+        app.state.sweep_task = asyncio.create_task(conversation_sweep_loop())
+
+    if COMPACTION_INTERVAL_SECONDS > 0:
+        app.state.compaction_task = asyncio.create_task(compaction_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background tasks and the forecasting process pool"""
+    for name in ("warmup_task", "sweep_task", "compaction_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    shutdown_forecast_pool()
 
 
 # Health check endpoint for monitoring
@@ -540,7 +606,7 @@ async def health_check():
     curl -X GET "http://localhost:8000/health"
     """
     # Check data file access
-    data_file_accessible = os.path.exists(CSV_FILE)
+    data_file_accessible = consumption_store.exists()
     
     # Check AI service status
     ai_service_available = get_ai_orchestrator() is not None
@@ -549,7 +615,11 @@ async def health_check():
         "status": "healthy" if data_file_accessible and ai_service_available else "degraded",
         "timestamp": datetime.now().isoformat(),
         "data_storage": "accessible" if data_file_accessible else "inaccessible",
-        "ai_service": "available" if ai_service_available else "unavailable"
+        "ai_service": "available" if ai_service_available else "unavailable",
+        "conversation_memory": conversation_memory.stats(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "predictor": consumption_predictor.stats()
     }
 
 # At the end of your main app file, before the if __name__ == "__main__" block:
@@ -584,36 +654,22 @@ async def smart_meal_planner(request: MealPlanRequest = Body(...)):
         # Generate meal plan
         meal_plan = await generate_meal_plan(request)
         
-        # Extract all required ingredients from the meal plan
-        required_ingredients = set()
-        
-        # Collect ingredients from all meals
-        for meal_type in ["breakfast", "lunch", "dinner"]:
-            meal = getattr(meal_plan, meal_type)
-            for ingredient in meal.ingredients:
-                # Extract just the ingredient name without quantity
-                # Assuming format like "2 cups rice" or "500g flour"
-                parts = ingredient.split(" ", 1)
-                if len(parts) > 1 and (parts[0].isdigit() or any(char.isdigit() for char in parts[0])):
-                    ingredient_name = parts[1]
-                else:
-                    ingredient_name = ingredient
-                
-                # Clean up the ingredient name (remove common suffixes)
-                for suffix in [", chopped", ", diced", ", sliced", ", minced"]:
-                    if suffix in ingredient_name:
-                        ingredient_name = ingredient_name.split(suffix)[0]
-                
-                required_ingredients.add(ingredient_name.strip().lower())
+        # Parse and total the ingredients of all meals
+        required_ingredients = aggregate_ingredients(
+            ingredient
+            for meal_type in ["breakfast", "lunch", "dinner"]
+            for ingredient in getattr(meal_plan, meal_type).ingredients
+        )
         
-        # Check which ingredients are missing from inventory
-        inventory_items = {item.item_name.lower() for item in request.inventory}
-        missing_ingredients = [ing for ing in required_ingredients if not any(inv in ing or ing in inv for inv in inventory_items)]
+        # Check which ingredients are missing from inventory, or not in sufficient quantity
+        matcher = InventoryMatcher.from_items(request.inventory)
+        missing_ingredients = matcher.missing(required_ingredients)
+        insufficient_ingredients = matcher.shortfall(required_ingredients.values())
         
         # Get AI recommendations for the missing ingredients
         recommendation_tasks = []
         for ingredient in missing_ingredients[:5]:  # Limit to 5 ingredients for recommendations
-            task = get_similar_products(ingredient)
+            task = get_similar_products(ingredient, BULK)
             recommendation_tasks.append((ingredient, task))
         
         # Wait for recommendations
@@ -637,13 +693,17 @@ async def smart_meal_planner(request: MealPlanRequest = Body(...)):
         
         return {
             "status": "success",
+            "degraded": is_degraded(),
             "meal_plan": formatted_meal_plan,
             "shopping_suggestions": {
                 "missing_ingredients": missing_ingredients,
+                "insufficient_ingredients": insufficient_ingredients,
                 "recommendations": recommendations
             }
         }
         
+    except UnknownInventoryVersion as e:
+        raise HTTPException(status_code=409, detail=f"Unknown inventory version: {str(e)}")
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -657,6 +717,10 @@ async def enhanced_smart_shopping_list(data: dict = Body(...)):
     3. Today's meal plan requirements
     4. Similar product recommendations
     
+    Instead of "inventory", callers may send "inventory_version" alone (if this
+    service has already seen it) or "base_version" + "inventory_delta"
+    ({"upserted": [...], "removed": [...]}). Unknown versions return 409.
+    
     Example curl:
     curl -X POST "http://localhost:8000/enhanced_smart_shopping_list/" 
          -H "Content-Type: application/json" 
@@ -670,57 +734,42 @@ async def enhanced_smart_shopping_list(data: dict = Body(...)):
     try:
         # Part 1: Process existing consumption data
         df = load_data()
-        df["date_consumed"] = pd.to_datetime(df["date_consumed"], errors='coerce')
-        df = df.sort_values(["item_name", "date_consumed"])
 
-        # Extract inventory from request
-        inventory = data.get("inventory", [])
+        # Extract inventory from request (full list, known version, or delta against a version)
+        inventory = inventory_store.resolve(
+            inventory=data.get("inventory"),
+            inventory_version=data.get("inventory_version"),
+            base_version=data.get("base_version"),
+            inventory_delta=data.get("inventory_delta")
+        )
         inventory_dict = {item["item_name"].lower(): item for item in inventory}
         
         shopping_list = []
         recommendation_tasks = []
         items_to_recommend = []
         
-        # Process consumption data and identify items running low
-        for item_name, group in df.groupby("item_name"):
-            if len(group) < 3:
-                continue
-
-            group["date_diff"] = group["date_consumed"].diff().dt.days
-            group["date_diff"] = group["date_diff"].replace(0, 1).fillna(1)
-            group["daily_usage"] = group["quantity_used"] / group["date_diff"]
-
-            group["daily_usage"] = group["daily_usage"].replace([float('inf'), -float('inf')], None).dropna()
-            if group["daily_usage"].isna().all():
-                continue
-
-            avg_daily_usage = group["daily_usage"].mean()
-            remaining_stock = group.iloc[-1]["remaining_stock"]
-
-            # Update remaining stock if item is in the provided inventory
-            inventory_item = inventory_dict.get(item_name.lower())
-            if inventory_item:
-                # If item is in inventory, use that quantity instead
-                remaining_stock = inventory_item["quantity"]
-
-            if avg_daily_usage <= 0:
+        # Forecast every logged item with the same forecaster as /predict, using
+        # the provided inventory's quantity as remaining stock where it has one
+        item_names = list(df["item_name"].dropna().unique())
+        stock_overrides = {
+            item_name: inventory_dict[item_name.lower()]["quantity"]
+            for item_name in item_names
+            if item_name.lower() in inventory_dict
+        }
+        predictions = await asyncio.to_thread(consumption_predictor.predict_many, item_names, stock_overrides)
+        for item_name, prediction in predictions.items():
+            if prediction["status"] != "success" or prediction["days_until_empty"] >= 7:
                 continue
-
-            days_until_empty = remaining_stock / avg_daily_usage
-            expiry_date = datetime.now() + timedelta(days=days_until_empty)
-
-            if days_until_empty < 7:  # Changed threshold to 7 days
-                items_to_recommend.append(item_name)
-                
-                shopping_list.append({
-                    "item_name": item_name,
-                    "refill_by": expiry_date.strftime('%Y-%m-%d'),
-                    "remaining_stock": remaining_stock,
-                    "daily_usage": round(avg_daily_usage, 2),
-                    "days_left": round(days_until_empty, 1),
-                    "suggested_similar_items": [],  # Will be filled later
-                    "source": "consumption_prediction"
-                })
+            items_to_recommend.append(item_name)
+            shopping_list.append({
+                "item_name": item_name,
+                "refill_by": prediction["refill_date"],
+                "remaining_stock": prediction["remaining_stock"],
+                "daily_usage": prediction["daily_usage"],
+                "days_left": prediction["days_until_empty"],
+                "suggested_similar_items": [],  # Will be filled later
+                "source": "consumption_prediction"
+            })
         
         # Part 2: Process today's meal plan and find missing ingredients
         try:
@@ -734,41 +783,29 @@ async def enhanced_smart_shopping_list(data: dict = Body(...)):
                 today = datetime.now().date()
                 
                 if plan_date == today:
-                    # Extract ingredients from all meals
-                    required_ingredients = set()
-                    
-                    for meal_type in ["breakfast", "lunch", "dinner"]:
-                        if meal_type in latest_meal_plan:
-                            meal = latest_meal_plan[meal_type]
-                            for ingredient in meal.get("ingredients", []):
-                                # Extract ingredient name without quantity
-                                parts = ingredient.split(" ", 1)
-                                if len(parts) > 1 and (parts[0].isdigit() or any(char.isdigit() for char in parts[0])):
-                                    ingredient_name = parts[1]
-                                else:
-                                    ingredient_name = ingredient
-                                
-                                # Clean up ingredient name
-                                for suffix in [", chopped", ", diced", ", sliced", ", minced"]:
-                                    if suffix in ingredient_name:
-                                        ingredient_name = ingredient_name.split(suffix)[0]
-                                
-                                required_ingredients.add(ingredient_name.strip().lower())
+                    # Parse and total the ingredients of all meals
+                    required_ingredients = aggregate_ingredients(
+                        ingredient
+                        for meal_type in ["breakfast", "lunch", "dinner"]
+                        if meal_type in latest_meal_plan
+                        for ingredient in latest_meal_plan[meal_type].get("ingredients", [])
+                    )
                     
                     # Check which ingredients are missing from inventory
-                    inventory_items = {item["item_name"].lower() for item in inventory}
+                    matcher = InventoryMatcher.from_items(inventory)
                     
                     # Also check against items in the consumption log
-                    existing_items = {item_name.lower() for item_name in df["item_name"].unique()}
-                    available_items = inventory_items.union(existing_items)
+                    for item_name in df["item_name"].unique():
+                        matcher.add(item_name)
                     
-                    missing_ingredients = [ing for ing in required_ingredients 
-                                          if not any(inv in ing or ing in inv for inv in available_items)]
+                    missing_ingredients = matcher.missing(required_ingredients)
                     
                     # Add missing ingredients to the shopping list
+                    listed = {item["item_name"].lower() for item in shopping_list}
                     for ingredient in missing_ingredients:
                         # Check if already in shopping list
-                        if not any(item["item_name"].lower() == ingredient.lower() for item in shopping_list):
+                        if ingredient.lower() not in listed:
+                            listed.add(ingredient.lower())
                             items_to_recommend.append(ingredient.title())
                             
                             shopping_list.append({
@@ -780,6 +817,22 @@ async def enhanced_smart_shopping_list(data: dict = Body(...)):
                                 "suggested_similar_items": [],
                                 "source": "meal_plan_requirement"
                             })
+                    
+                    # Add ingredients the inventory holds too little of for today's meals
+                    for shortfall in matcher.shortfall(required_ingredients.values()):
+                        if shortfall["item_name"] not in listed:
+                            listed.add(shortfall["item_name"])
+                            shopping_list.append({
+                                "item_name": shortfall["item_name"].title(),
+                                "refill_by": today.strftime('%Y-%m-%d'),
+                                "remaining_stock": shortfall["available"],
+                                "daily_usage": None,
+                                "days_left": 0,
+                                "suggested_similar_items": [],
+                                "source": "meal_plan_shortfall",
+                                "shortfall": shortfall["shortfall"],
+                                "unit": shortfall["unit"]
+                            })
         except Exception as e:
             print(f"Error processing meal plan data: {e}")
             # Continue with the rest of the function even if meal plan processing fails
@@ -793,7 +846,7 @@ async def enhanced_smart_shopping_list(data: dict = Body(...)):
         # Get AI recommendations for similar products in parallel
         recommendation_tasks = []
         for item_name in items_to_recommend:
-            task = get_similar_products(item_name)
+            task = get_similar_products(item_name, BULK)
             recommendation_tasks.append((item_name, task))
             
         # Wait for all recommendation tasks to complete
@@ -806,66 +859,17 @@ async def enhanced_smart_shopping_list(data: dict = Body(...)):
                 print(f"Error getting recommendations for {item_name}: {e}")
                 recommendation_results[item_name.lower()] = []
         
-        # Update shopping list with recommendations
-        for item in shopping_list:
-            item_key = item["item_name"].lower()
-            if item_key in recommendation_results:
-                item["suggested_similar_items"] = recommendation_results[item_key]
-            else:
-                # Try partial matching
-                for rec_key in recommendation_results:
-                    if rec_key in item_key or item_key in rec_key:
-                        item["suggested_similar_items"] = recommendation_results[rec_key]
-                        break
-        
-        # Add related items based on similar product recommendations
-        related_items = set()
-        for item in shopping_list:
-            for similar_item in item["suggested_similar_items"]:
-                related_items.add(similar_item.lower())
-        
-        # Check if any recommended/similar items are missing from the shopping list
-        for related_item in related_items:
-            # Skip if already on the list
-            if any(item["item_name"].lower() == related_item for item in shopping_list):
-                continue
-                
-            # Check if in inventory with sufficient quantity
-            in_inventory = False
-            for inv_item in inventory:
-                if inv_item["item_name"].lower() == related_item:
-                    in_inventory = True
-                    break
-                    
-            if not in_inventory:
-                # Add as a suggested complementary item
-                shopping_list.append({
-                    "item_name": related_item.title(),
-                    "refill_by": None,
-                    "remaining_stock": None,
-                    "daily_usage": None,
-                    "days_left": None,
-                    "suggested_similar_items": [],
-                    "source": "complementary_suggestion"
-                })
-        
-        # Categorize items
-        urgent_items = [item for item in shopping_list if item.get("days_left", 0) is not None and item.get("days_left", 0) <= 2]
-        meal_plan_items = [item for item in shopping_list if item.get("source") == "meal_plan_requirement"]
-        complementary_items = [item for item in shopping_list if item.get("source") == "complementary_suggestion"]
-        other_items = [item for item in shopping_list if item not in urgent_items and item not in meal_plan_items and item not in complementary_items]
+        # Attach recommendations, add complementary suggestions and categorize
+        categorized = assemble_shopping_list(shopping_list, recommendation_results, inventory_dict)
         
         return {
             "status": "success", 
-            "shopping_list": {
-                "urgent_items": urgent_items,
-                "meal_plan_items": meal_plan_items,
-                "other_items": other_items,
-                "complementary_suggestions": complementary_items
-            },
+            "shopping_list": categorized,
             "total_items": len(shopping_list)
         }
         
+    except UnknownInventoryVersion as e:
+        raise HTTPException(status_code=409, detail=f"Unknown inventory version: {str(e)}")
     except Exception as e:
         print(f"Error generating enhanced shopping list: {e}")
         import traceback
@@ -882,45 +886,26 @@ async def kitchen_dashboard():
     curl -X GET "http://localhost:8000/kitchen_dashboard/"
     """
     try:
-        # Get inventory items
-        df = load_data()
+        # Every known item's latest status and prediction, from the same
+        # cached forecaster as /predict (summaries included)
+        latest = await asyncio.to_thread(consumption_predictor.latest)
+        predictions = await asyncio.to_thread(consumption_predictor.predict_many, list(latest))
         
-        # Get unique items and their latest status
         items_data = []
-        for item_name, group in df.groupby("item_name"):
-            latest = group.sort_values(by="date_consumed", ascending=True).iloc[-1]
-
-            # latest = group.sort_values("date_consumed").iloc[-1]
-            
-            # Calculate consumption prediction
+        for item_name, status in latest.items():
+            # Items with fewer than 3 data points or invalid data have no prediction
             prediction = None
-            try:
-                group["date_consumed"] = pd.to_datetime(group["date_consumed"])
-                group = group.sort_values("date_consumed")
-                
-                if len(group) >= 3:  # Need at least 3 data points for prediction
-                    group["date_diff"] = group["date_consumed"].diff().dt.days
-                    group["date_diff"] = group["date_diff"].replace(0, 1).fillna(1)
-                    group["daily_usage"] = group["quantity_used"] / group["date_diff"]
-                    
-                    avg_daily_usage = group["daily_usage"].mean()
-                    remaining_stock = latest["remaining_stock"]
-                    
-                    if avg_daily_usage > 0 and remaining_stock > 0:
-                        days_until_empty = remaining_stock / avg_daily_usage
-                        refill_date = datetime.now() + timedelta(days=days_until_empty)
-                        
-                        prediction = {
-                            "days_until_empty": round(days_until_empty, 1),
-                            "refill_date": refill_date.strftime('%Y-%m-%d')
-                        }
-            except Exception as e:
-                print(f"Error calculating prediction for {item_name}: {e}")
+            result = predictions[item_name]
+            if result["status"] == "success":
+                prediction = {
+                    key: result[key] for key in ("days_until_empty", "refill_date", "method", "confidence_interval")
+                }
             
+            last_date = status["last_date"]
             items_data.append({
                 "item_name": item_name,
-                "remaining_stock": latest["remaining_stock"],
-                "last_used": pd.to_datetime(latest["date_consumed"]).strftime('%Y-%m-%d'),
+                "remaining_stock": status["remaining_stock"],
+                "last_used": last_date.strftime('%Y-%m-%d') if last_date is not None and not pd.isna(last_date) else None,
                 "prediction": prediction
             })
         
@@ -13,6 +13,13 @@ from moya.tools.tool_registry import ToolRegistry
 from moya.registry.agent_registry import AgentRegistry
 from moya.orchestrators.simple_orchestrator import SimpleOrchestrator
 from moya.agents.azure_openai_agent import AzureOpenAIAgent, AzureOpenAIAgentConfig
+from inventory_store import inventory_store, UnknownInventoryVersion
+from consumption_store import consumption_store
+from conversation_memory import conversation_memory
+from llm_scheduler import llm_scheduler, INTERACTIVE
+from deadlines import remaining, mark_degraded
+from response_parsing import parse_meal_plan_response
+from ingredient_matching import InventoryMatcher
 
 # New models for meal planning
 class InventoryItem(BaseModel):
@@ -31,8 +38,11 @@ class DietaryPreference(BaseModel):
 
 class MealPlanRequest(BaseModel):
     dietary_preferences: DietaryPreference
-    inventory: List[InventoryItem]
+    inventory: Optional[List[InventoryItem]] = None  # May be omitted when inventory_version is known
     meal_date: Optional[str] = None  # Default to today if not provided
+    inventory_version: Optional[str] = None
+    base_version: Optional[str] = None  # Version inventory_delta applies to
+    inventory_delta: Optional[Dict[str, Any]] = None  # {"upserted": [...], "removed": [...]}
 
 
 class RecipeDetails(BaseModel):
@@ -50,6 +60,11 @@ class MealPlan(BaseModel):
     lunch: RecipeDetails 
     dinner: RecipeDetails
     suggested_recipes: List[RecipeDetails] = []
+    degraded: bool = False  # True when served from a previous plan after the deadline
+
+
+# Longest the meal plan LLM call may take before falling back (capped by X-Deadline-Ms)
+MEAL_PLAN_DEADLINE_SECONDS = float(os.environ.get("MEAL_PLAN_DEADLINE_SECONDS", "60"))
 
 
 # Store for previous meal plans
@@ -137,11 +152,26 @@ def get_meal_planning_orchestrator():
     return get_meal_planning_orchestrator.instance
 
 
+def resolve_request_inventory(request: MealPlanRequest) -> List[InventoryItem]:
+    """Fill request.inventory from the inventory store when only a version or delta was sent"""
+    inventory = None
+    if request.inventory is not None:
+        inventory = [item.dict() for item in request.inventory]
+    
+    resolved = inventory_store.resolve(
+        inventory=inventory,
+        inventory_version=request.inventory_version,
+        base_version=request.base_version,
+        inventory_delta=request.inventory_delta
+    )
+    request.inventory = [InventoryItem(**item) for item in resolved]
+    return request.inventory
+
+
 def load_consumption_data():
-    """Load consumption data from CSV"""
+    """Load consumption data from the partitions in the lookback window"""
     try:
-        CSV_FILE = "data/consumption_log.csv"
-        df = pd.read_csv(CSV_FILE)
+        df = consumption_store.read()
         # Handle date parsing more flexibly
         df["date_consumed"] = pd.to_datetime(df["date_consumed"], errors='coerce')
         return df
@@ -243,6 +273,45 @@ def save_meal_plan(meal_plan):
         return False
 
 
+def fallback_meal_plan(request: MealPlanRequest, meal_date: str) -> Optional[MealPlan]:
+    """
+    Degraded plan for when the AI misses its deadline: reuse the previous plan
+    whose breakfast/lunch/dinner ingredients are best covered by the inventory
+    and that doesn't use ingredients the preferences say to avoid.
+    """
+    inventory = InventoryMatcher.from_items(request.inventory)
+    avoid = InventoryMatcher(request.dietary_preferences.avoid_ingredients)
+    
+    best_plan, best_score = None, -1.0
+    for plan in load_previous_meal_plans():
+        try:
+            ingredients = [
+                ingredient.lower()
+                for meal_type in ["breakfast", "lunch", "dinner"]
+                for ingredient in plan[meal_type].get("ingredients", [])
+            ]
+        except (KeyError, AttributeError):
+            continue
+        if any(avoid.matches(ingredient) for ingredient in ingredients):
+            continue
+        covered = sum(1 for ingredient in ingredients if inventory.matches(ingredient))
+        score = covered / len(ingredients) if ingredients else 0.0
+        if score >= best_score:  # ties go to the more recent plan
+            best_plan, best_score = plan, score
+    
+    if best_plan is None:
+        return None
+    
+    return MealPlan(
+        date=meal_date,
+        breakfast=RecipeDetails(**best_plan["breakfast"]),
+        lunch=RecipeDetails(**best_plan["lunch"]),
+        dinner=RecipeDetails(**best_plan["dinner"]),
+        suggested_recipes=[RecipeDetails(**recipe) for recipe in best_plan.get("suggested_recipes", []) if isinstance(recipe, dict)],
+        degraded=True
+    )
+
+
 async def generate_meal_plan(request: MealPlanRequest) -> MealPlan:
     """Generate a meal plan using the AI orchestrator"""
     orchestrator = get_meal_planning_orchestrator()
@@ -250,6 +319,9 @@ async def generate_meal_plan(request: MealPlanRequest) -> MealPlan:
     if not orchestrator:
         raise ValueError("Meal planning AI engine not available")
     
+    # Resolve versioned/delta inventory into the full item list
+    resolve_request_inventory(request)
+    
     # Get consumption patterns
     consumption_patterns = get_consumption_patterns()
     
@@ -311,87 +383,29 @@ async def generate_meal_plan(request: MealPlanRequest) -> MealPlan:
     Return your response in JSON format.
     """
     
+    thread_id = f"meal_plan_{datetime.now().strftime('%Y%m%d%H%M%S')}"
     try:
         # Generate response from AI
-        response = orchestrator.orchestrate(
-            thread_id=f"meal_plan_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-            user_message=prompt
-        )
-        
-        # Parse JSON response
         try:
-            plan_data = json.loads(response)
-        except json.JSONDecodeError:
-            # If the response isn't valid JSON, try to extract JSON content
-            import re
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response)
-            if json_match:
-                plan_data = json.loads(json_match.group(1))
-            else:
-                raise ValueError("Could not parse AI response as JSON")
-        
-        # Transform the data to match the RecipeDetails model format
-        def transform_recipe_data(recipe_data):
-            # Handle the name field
-            if "recipe_name" in recipe_data and "name" not in recipe_data:
-                recipe_data["name"] = recipe_data.pop("recipe_name")
-            
-            # Handle ingredients as objects
-            if "ingredients" in recipe_data and recipe_data["ingredients"] and isinstance(recipe_data["ingredients"][0], dict):
-                transformed_ingredients = []
-                for ing in recipe_data["ingredients"]:
-                    if isinstance(ing, dict):
-                        # Format ingredient as string
-                        item_name = ing.get("item_name", "")
-                        quantity = ing.get("quantity", "")
-                        unit = ing.get("unit", "")
-                        ingredient_str = f"{quantity} {unit} {item_name}".strip()
-                        transformed_ingredients.append(ingredient_str)
-                    else:
-                        transformed_ingredients.append(ing)
-                recipe_data["ingredients"] = transformed_ingredients
-            
-            # Handle prep_time field
-            if "prep_time" in recipe_data and isinstance(recipe_data["prep_time"], str):
-                # Extract the numeric part from strings like "15 minutes"
-                import re
-                match = re.search(r'(\d+)', recipe_data["prep_time"])
-                if match:
-                    recipe_data["prep_time"] = int(match.group(1))
-                else:
-                    recipe_data["prep_time"] = None
-            
-            return recipe_data
-        
-        # Transform all recipe data
-        for meal_type in ["breakfast", "lunch", "dinner"]:
-            if meal_type in plan_data:
-                plan_data[meal_type] = transform_recipe_data(plan_data[meal_type])
-        
-        if "suggested_recipes" in plan_data and isinstance(plan_data["suggested_recipes"], list):
-            plan_data["suggested_recipes"] = [transform_recipe_data(recipe) for recipe in plan_data["suggested_recipes"]]
-        
-        # Convert to MealPlan object
-        breakfast = RecipeDetails(**plan_data["breakfast"])
-        lunch = RecipeDetails(**plan_data["lunch"])
-        dinner = RecipeDetails(**plan_data["dinner"])
+            response = await asyncio.wait_for(
+                llm_scheduler.run(
+                    lambda: orchestrator.orchestrate(thread_id=thread_id, user_message=prompt),
+                    INTERACTIVE
+                ),
+                timeout=remaining(MEAL_PLAN_DEADLINE_SECONDS)
+            )
+        except asyncio.TimeoutError:
+            fallback = fallback_meal_plan(request, meal_date)
+            if fallback is None:
+                raise ValueError("Meal plan deadline exceeded and no previous plan to fall back on")
+            print("Meal plan deadline exceeded, serving an adapted previous plan")
+            mark_degraded()
+            return fallback
         
-        suggested_recipes = []
-        if "suggested_recipes" in plan_data and isinstance(plan_data["suggested_recipes"], list):
-            for recipe_data in plan_data["suggested_recipes"]:
-                if isinstance(recipe_data, dict):  # Ensure recipe_data is a dictionary
-                    suggested_recipes.append(RecipeDetails(**recipe_data))
-                else:
-                    print(f"Skipping invalid recipe_data: {recipe_data}")
-             
+        # Extract the JSON plan and coerce it into RecipeDetails/MealPlan fields
+        plan_data = parse_meal_plan_response(response)
         
-        meal_plan = MealPlan(
-            date=meal_date,
-            breakfast=breakfast,
-            lunch=lunch,
-            dinner=dinner,
-            suggested_recipes=suggested_recipes
-        )
+        meal_plan = MealPlan(date=meal_date, **plan_data)
         
         # Save the meal plan
         save_meal_plan(meal_plan)
@@ -402,6 +416,9 @@ async def generate_meal_plan(request: MealPlanRequest) -> MealPlan:
         import traceback
         traceback.print_exc()
         raise ValueError(f"Failed to generate meal plan: {str(e)}")
+    finally:
+        # One-shot thread: don't keep its conversation around
+        conversation_memory.release(thread_id)
 
 
 # Add this endpoint to your FastAPI app
@@ -430,6 +447,8 @@ def register_meal_planning_endpoints(app):
         try:
             meal_plan = await generate_meal_plan(request)
             return meal_plan
+        except UnknownInventoryVersion as e:
+            raise HTTPException(status_code=409, detail=f"Unknown inventory version: {str(e)}")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error generating meal plan: {str(e)}")
 
@@ -0,0 +1,186 @@
+"""
+Offline backtest for the consumption forecasters.
+
+Replays the consumption log in date order, item by item. After every event
+(once an item has MIN_HISTORY events) each method predicts days_until_empty.
+That prediction is scored against the actual stock-out: the first later
+event at which cumulative usage since the prediction reaches the stock on
+hand then. Predictions whose stock-out is not in the log are skipped.
+
+    python -m models.backtest [csv_file] [workers]   (default: the whole consumption store)
+    python -m models.backtest --synthetic [items] [events_per_item] [workers]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.forecasting import FORECAST_METHODS, ForecastState
+from models.predictor import load_consumption_log
+
+MIN_HISTORY = 3  # same minimum as the endpoints
+
+ItemSeries = Tuple[str, np.ndarray, np.ndarray, np.ndarray]
+
+
+def actual_days_to_stockout(days: np.ndarray, used: np.ndarray, stock: np.ndarray) -> np.ndarray:
+    """
+    For each event i, days from event i until cumulative later usage reaches
+    stock[i]; NaN when that never happens within the log. Vectorized with a
+    cumulative sum and searchsorted.
+    """
+    cumulative = np.cumsum(np.clip(used, 0, None))
+    target = cumulative + stock
+    reached = np.searchsorted(cumulative, target, side="left")
+    valid = (stock > 0) & (reached < len(days))
+    result = np.full(len(days), np.nan)
+    result[valid] = days[reached[valid]] - days[valid]
+    return result
+
+
+def _empty_scores() -> Dict[str, float]:
+    return {"predictions": 0, "scored": 0, "abs_error": 0.0, "error": 0.0, "covered": 0, "seconds": 0.0}
+
+
+def score_items(series: List[ItemSeries], methods: Iterable[str] = FORECAST_METHODS) -> Dict[str, Dict[str, float]]:
+    """Replay each item's events through every method and accumulate error and timing totals"""
+    totals = {method: _empty_scores() for method in methods}
+    for _, dates, used, stock in series:
+        days = dates.astype("datetime64[D]").astype(np.int64)
+        actual = actual_days_to_stockout(days, used, stock)
+        timestamps = pd.to_datetime(dates).to_pydatetime()
+
+        for method, scores in totals.items():
+            state = ForecastState(method=method)
+            for index in range(len(days)):
+                start = time.perf_counter()
+                state.update(timestamps[index], used[index], stock[index])
+                forecast = state.forecast(start=timestamps[index]) if index + 1 >= MIN_HISTORY else None
+                elapsed = time.perf_counter() - start
+                if index + 1 < MIN_HISTORY:
+                    continue
+
+                scores["predictions"] += 1
+                scores["seconds"] += elapsed
+                if forecast is None or np.isnan(actual[index]):
+                    continue
+                error = forecast["days_until_empty"] - actual[index]
+                scores["scored"] += 1
+                scores["abs_error"] += abs(error)
+                scores["error"] += error
+                high = forecast["high"] if forecast["high"] is not None else float("inf")
+                if forecast["low"] <= actual[index] <= high:
+                    scores["covered"] += 1
+    return totals
+
+
+def split_items(df: pd.DataFrame) -> List[ItemSeries]:
+    """Per-item (name, dates, quantity_used, remaining_stock) arrays in date order"""
+    df = df.assign(date_consumed=pd.to_datetime(df["date_consumed"], format="mixed", errors="coerce"))
+    df = df.dropna(subset=["date_consumed"]).sort_values(["item_name", "date_consumed"], kind="stable")
+    series = []
+    for item_name, group in df.groupby("item_name", sort=False):
+        series.append((
+            item_name,
+            group["date_consumed"].to_numpy(dtype="datetime64[ns]"),
+            group["quantity_used"].to_numpy(dtype=float),
+            group["remaining_stock"].to_numpy(dtype=float)
+        ))
+    return series
+
+
+def _merge(results: Iterable[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    merged = {}
+    for result in results:
+        for method, scores in result.items():
+            total = merged.setdefault(method, _empty_scores())
+            for key, value in scores.items():
+                total[key] += value
+    return merged
+
+
+def backtest(df: pd.DataFrame, methods: Iterable[str] = FORECAST_METHODS, workers: int = 1) -> Dict[str, Dict[str, float]]:
+    """
+    Score every method on the consumption log. With workers > 1, items are
+    split into chunks and scored in a process pool.
+    Returns per-method MAE/bias (days), interval coverage and compute time.
+    """
+    methods = list(methods)
+    series = split_items(df)
+    if workers > 1 and len(series) > 1:
+        chunk_size = max(1, len(series) // (workers * 4))
+        chunks = [series[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            totals = _merge(pool.map(score_items, chunks, [methods] * len(chunks)))
+    else:
+        totals = score_items(series, methods)
+
+    report = {}
+    for method in methods:
+        scores = totals.get(method, _empty_scores())
+        scored = scores["scored"] or 1
+        report[method] = {
+            "predictions": scores["predictions"],
+            "scored": scores["scored"],
+            "mae_days": round(scores["abs_error"] / scored, 3),
+            "bias_days": round(scores["error"] / scored, 3),
+            "interval_coverage": round(scores["covered"] / scored, 3),
+            "us_per_prediction": round(scores["seconds"] / (scores["predictions"] or 1) * 1e6, 2)
+        }
+    return report
+
+
+def synthetic_log(items: int = 100, events_per_item: int = 200, seed: int = 0) -> pd.DataFrame:
+    """Consumption log with weekday-dependent usage, drifting rates and restocks"""
+    rng = np.random.default_rng(seed)
+    weekly = np.array([1.0, 0.9, 0.9, 1.0, 1.2, 1.6, 1.4])
+    frames = []
+    for item in range(items):
+        gaps = rng.integers(1, 4, events_per_item)
+        dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.cumsum(gaps), unit="D")
+        base = rng.uniform(0.2, 3.0) * np.linspace(1.0, rng.uniform(0.5, 1.5), events_per_item)
+        used = np.round(base * gaps * weekly[dates.weekday] * rng.uniform(0.7, 1.3, events_per_item), 2)
+
+        stock = np.empty(events_per_item)
+        capacity = base[0] * 20
+        level = capacity
+        for index in range(events_per_item):
+            if level - used[index] <= 0:
+                level = capacity  # restock before running dry
+            level -= used[index]
+            stock[index] = round(level, 2)
+
+        frames.append(pd.DataFrame({
+            "item_name": f"item_{item}",
+            "date_consumed": dates,
+            "quantity_used": used,
+            "remaining_stock": stock
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def print_report(report: Dict[str, Dict[str, float]], rows: int, seconds: float):
+    print(f"{rows} rows backtested in {seconds:.2f} s")
+    print(f"{'method':<10}{'predictions':>12}{'scored':>10}{'MAE days':>10}{'bias':>8}{'coverage':>10}{'us/pred':>10}")
+    for method, scores in report.items():
+        print(f"{method:<10}{scores['predictions']:>12}{scores['scored']:>10}{scores['mae_days']:>10}"
+              f"{scores['bias_days']:>8}{scores['interval_coverage']:>10}{scores['us_per_prediction']:>10}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "--synthetic":
+        numbers = [int(arg) for arg in args[1:]]
+        items, events, workers = (numbers + [100, 200, os.cpu_count() or 1][len(numbers):])[:3]
+        log = synthetic_log(items, events)
+    else:
+        log = load_consumption_log(args[0] if args and args[0] != "-" else None, lookback_months=0)
+        workers = int(args[1]) if len(args) > 1 else 1
+
+    started = time.perf_counter()
+    results = backtest(log, workers=workers)
+    print_report(results, len(log), time.perf_counter() - started)
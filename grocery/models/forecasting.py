@@ -0,0 +1,168 @@
+import json
+import math
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# "mean": plain average of daily usage (the original predictor)
+# "ewma": exponentially weighted average, reacts to recent behaviour
+# "seasonal": EWMA level times a per-weekday factor
+FORECAST_METHODS = ("mean", "ewma", "seasonal")
+DEFAULT_FORECAST_METHOD = os.environ.get("FORECAST_METHOD", "ewma")
+EWMA_ALPHA = float(os.environ.get("FORECAST_EWMA_ALPHA", "0.3"))
+SEASONAL_GAMMA = float(os.environ.get("FORECAST_SEASONAL_GAMMA", "0.1"))
+CONFIDENCE_Z = 1.96  # 95% interval
+MAX_FORECAST_DAYS = 365
+
+
+@lru_cache(maxsize=1)
+def item_methods() -> Dict[str, str]:
+    """
+    Per-item overrides from FORECAST_ITEM_METHODS, e.g. '{"Milk": "seasonal",
+    "Rice": "mean"}'. Parsed on first use; a malformed value is logged and
+    ignored rather than stopping the service.
+    """
+    try:
+        overrides = json.loads(os.environ.get("FORECAST_ITEM_METHODS", "{}"))
+        if not isinstance(overrides, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        print(f"Ignoring invalid FORECAST_ITEM_METHODS: {e}")
+        return {}
+    methods = {}
+    for name, method in overrides.items():
+        if method in FORECAST_METHODS:
+            methods[str(name).lower()] = method
+        else:
+            print(f"Ignoring unknown forecast method {method!r} for {name} in FORECAST_ITEM_METHODS")
+    return methods
+
+
+def method_for(item_name: str, method: Optional[str] = None) -> str:
+    """Forecast method for an item: explicit argument, per-item override, then default"""
+    method = method or item_methods().get(item_name.lower(), DEFAULT_FORECAST_METHOD)
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method: {method}")
+    return method
+
+
+@dataclass
+class ForecastState:
+    """
+    Running forecast state for one item. update() folds in one consumption
+    event in O(1), so the state never needs the full history again.
+
+    level is the average daily usage (deseasonalized for "seasonal");
+    variance is Welford's M2 for "mean" and the EWM variance otherwise.
+    """
+    method: str = DEFAULT_FORECAST_METHOD
+    count: int = 0
+    last_date: Optional[datetime] = None
+    remaining_stock: float = 0.0
+    level: float = 0.0
+    variance: float = 0.0
+    season: List[float] = field(default_factory=lambda: [1.0] * 7)
+
+    @classmethod
+    def from_summary(cls, summary: dict, method: str) -> "ForecastState":
+        """
+        Start from a compacted per-item summary (see consumption_store), so
+        long-horizon usage still counts when only recent rows are replayed.
+        """
+        count = int(summary["rate_count"])
+        state = cls(
+            method=method,
+            count=count,
+            last_date=pd.Timestamp(summary["last_date"]) if not pd.isna(summary["last_date"]) else None,
+            remaining_stock=float(summary["last_remaining"]),
+            level=float(summary["rate_mean"])
+        )
+        m2 = float(summary["rate_m2"])
+        state.variance = m2 if method == "mean" else (m2 / (count - 1) if count > 1 else 0.0)
+        if method == "seasonal":
+            weekday_used = [float(summary[f"weekday_{day}_used"]) for day in range(7)]
+            total = sum(weekday_used)
+            if total > 0 and all(weekday_used):
+                state.season = [used * 7 / total for used in weekday_used]
+        return state
+
+    def update(self, date, quantity_used: float, remaining_stock: float):
+        # Usage is spread over the days since the previous event (at least one day)
+        if pd.isna(date) or self.last_date is None or pd.isna(self.last_date):
+            days = 1
+        else:
+            days = max((date - self.last_date).days, 1)
+        self.last_date = date
+        self.remaining_stock = float(remaining_stock)
+
+        rate = float(quantity_used) / days
+        if not math.isfinite(rate):
+            return
+        self.count += 1
+
+        if self.method == "mean":
+            delta = rate - self.level
+            self.level += delta / self.count
+            self.variance += delta * (rate - self.level)
+            return
+
+        weekday = None if pd.isna(date) else date.weekday()
+        factor = self.season[weekday] if self.method == "seasonal" and weekday is not None else 1.0
+        value = rate / factor if factor > 0 else rate
+        if self.count == 1:
+            self.level = value
+        else:
+            residual = value - self.level
+            self.level += EWMA_ALPHA * residual
+            self.variance = (1 - EWMA_ALPHA) * (self.variance + EWMA_ALPHA * residual ** 2)
+
+        if self.method == "seasonal" and weekday is not None and self.level > 0:
+            self.season[weekday] += SEASONAL_GAMMA * (rate / self.level - self.season[weekday])
+            total = sum(self.season)
+            if total > 0:
+                self.season = [weight * 7 / total for weight in self.season]
+
+    def level_stderr(self) -> float:
+        """Standard error of the usage level"""
+        if self.method == "mean":
+            if self.count < 2:
+                return 0.0
+            return math.sqrt(self.variance / (self.count - 1)) / math.sqrt(self.count)
+        # An EWMA averages over roughly (2 - alpha) / alpha effective samples
+        return math.sqrt(self.variance) * math.sqrt(EWMA_ALPHA / (2 - EWMA_ALPHA))
+
+    def days_until_empty(self, level: Optional[float] = None, start: Optional[datetime] = None) -> Optional[float]:
+        """Days until remaining stock is used up at the given level, None if never"""
+        level = self.level if level is None else level
+        if level <= 0 or self.remaining_stock <= 0:
+            return None
+        if self.method != "seasonal":
+            return self.remaining_stock / level
+
+        # Walk forward day by day through the weekly pattern
+        weekday = (start or datetime.now()).weekday()
+        used = 0.0
+        for day in range(MAX_FORECAST_DAYS):
+            today = level * self.season[(weekday + day) % 7]
+            if used + today >= self.remaining_stock:
+                return day + (self.remaining_stock - used) / today
+            used += today
+        return self.remaining_stock / level
+
+    def forecast(self, start: Optional[datetime] = None) -> Optional[Dict[str, Optional[float]]]:
+        """
+        Point estimate and confidence interval for days_until_empty. The
+        interval comes from the uncertainty of the usage level; "high" is None
+        when zero usage can't be ruled out. Returns None without usable data.
+        """
+        days = self.days_until_empty(start=start)
+        if days is None:
+            return None
+        margin = CONFIDENCE_Z * self.level_stderr()
+        low = self.days_until_empty(self.level + margin, start)
+        high = self.days_until_empty(self.level - margin, start) if self.level - margin > 0 else None
+        return {"days_until_empty": days, "low": low, "high": high}
@@ -0,0 +1,199 @@
+"""
+Forecast every item in the consumption log, in a process pool when there
+are many items.
+
+The log's columns are encoded as numpy arrays and copied once into a
+shared-memory block. Items are assigned to partitions by a stable hash of
+their name; each worker attaches to the block, fits its partition's items
+and returns only the per-item results. Below PARALLEL_FORECAST_THRESHOLD
+items everything runs in-process.
+
+    python -m models.parallel_forecast [items] [events_per_item]
+"""
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.forecasting import ForecastState, method_for
+
+PARALLEL_FORECAST_THRESHOLD = int(os.environ.get("PARALLEL_FORECAST_THRESHOLD", "5000"))
+PARALLEL_FORECAST_WORKERS = int(os.environ.get("PARALLEL_FORECAST_WORKERS", str(os.cpu_count() or 1)))
+
+NAT = np.iinfo(np.int64).min
+_COLUMNS = (("codes", np.int64), ("dates", np.int64), ("used", np.float64), ("stock", np.float64))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool shared across requests, recreated if the worker count changes"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def partition_of(item_name: str, partitions: int) -> int:
+    """Stable across processes, unlike hash() on str"""
+    return zlib.crc32(item_name.encode("utf-8")) % partitions
+
+
+def _fit_arrays(codes, dates, used, stock, names: Dict[int, str],
+                initial: Optional[Dict[str, ForecastState]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit every item in the arrays, continuing from its initial state if it
+    has one; rows of one item are replayed in date order (NaT last)
+    """
+    initial = initial or {}
+    sort_dates = np.where(dates == NAT, np.iinfo(np.int64).max, dates)
+    order = np.lexsort((sort_dates, codes))
+    codes, used, stock = codes[order], used[order], stock[order]
+    timestamps = dates[order].astype("datetime64[ns]").astype("datetime64[us]").astype(object)
+
+    results = {}
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(codes)]):
+        if start == end:
+            continue
+        name = names[int(codes[start])]
+        state = initial.get(name) or ForecastState(method=method_for(name))
+        for index in range(start, end):
+            state.update(timestamps[index], used[index], stock[index])
+        results[name] = {
+            "rows": int(end - start),
+            "method": state.method,
+            "usable": state.count > 0,
+            "forecast": state.forecast(),
+            "remaining_stock": state.remaining_stock,
+            "last_date": state.last_date,
+            "state": state
+        }
+    return results
+
+
+def _fit_partition(shm_name: str, rows: int, names: Dict[int, str],
+                   initial: Dict[str, ForecastState]) -> Dict[str, Dict[str, Any]]:
+    """Worker: attach to the shared log, fit the items whose codes are in names"""
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        columns = {}
+        offset = 0
+        for column, dtype in _COLUMNS:
+            columns[column] = np.ndarray((rows,), dtype=dtype, buffer=block.buf, offset=offset)
+            offset += rows * np.dtype(dtype).itemsize
+
+        mask = np.isin(columns["codes"], np.fromiter(names, dtype=np.int64, count=len(names)))
+        return _fit_arrays(*(columns[column][mask].copy() for column, _ in _COLUMNS), names, initial)
+    finally:
+        del columns
+        block.close()
+
+
+def _encode(df: pd.DataFrame):
+    codes, uniques = pd.factorize(df["item_name"])
+    dates = pd.to_datetime(df["date_consumed"], format="mixed", errors="coerce")
+    return (
+        codes.astype(np.int64),
+        dates.to_numpy(dtype="datetime64[ns]").view(np.int64),
+        pd.to_numeric(df["quantity_used"], errors="coerce").to_numpy(dtype=np.float64),
+        pd.to_numeric(df["remaining_stock"], errors="coerce").to_numpy(dtype=np.float64),
+        list(uniques)
+    )
+
+
+def forecast_items(
+    df: pd.DataFrame,
+    workers: Optional[int] = None,
+    threshold: int = PARALLEL_FORECAST_THRESHOLD,
+    initial: Optional[Dict[str, ForecastState]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit and forecast every item in a consumption log frame, starting items
+    found in initial from that state (e.g. their compacted summaries; those
+    states are updated in place when fitting in-process).
+    Returns item_name -> {"rows", "method", "usable", "forecast" (see
+    ForecastState.forecast), "remaining_stock", "last_date", "state"}.
+    """
+    initial = initial or {}
+    df = df.dropna(subset=["item_name"])
+    if df.empty:
+        return {}
+    codes, dates, used, stock, names = _encode(df)
+    workers = PARALLEL_FORECAST_WORKERS if workers is None else workers
+
+    if workers <= 1 or len(names) < threshold:
+        return _fit_arrays(codes, dates, used, stock, dict(enumerate(names)), initial)
+
+    partitions: List[Dict[int, str]] = [{} for _ in range(workers)]
+    for code, name in enumerate(names):
+        partitions[partition_of(str(name), workers)][code] = name
+
+    rows = len(codes)
+    block = shared_memory.SharedMemory(create=True, size=max(1, rows * 8 * len(_COLUMNS)))
+    try:
+        offset = 0
+        for values, (_, dtype) in zip((codes, dates, used, stock), _COLUMNS):
+            np.ndarray((rows,), dtype=dtype, buffer=block.buf, offset=offset)[:] = values
+            offset += rows * np.dtype(dtype).itemsize
+
+        pool = _get_pool(workers)
+        futures = [
+            pool.submit(_fit_partition, block.name, rows, names, {name: initial[name] for name in names.values() if name in initial})
+            for names in partitions if names
+        ]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+    finally:
+        block.close()
+        block.unlink()
+
+
+def benchmark_scaling(items: int = 20000, events_per_item: int = 20):
+    """Time forecast_items on a synthetic log for 1, 2, 4, ... workers up to the core count"""
+    from models.backtest import synthetic_log
+
+    log = synthetic_log(items, events_per_item)
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+
+    baseline = None
+    for workers in counts:
+        forecast_items(log.head(1000), workers=workers, threshold=0)  # start the pool outside the timing
+        start = time.perf_counter()
+        results = forecast_items(log, workers=workers, threshold=0)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:>3} workers: {elapsed:.2f} s for {len(results)} items, {len(log)} rows (speedup {baseline / elapsed:.2f}x)")
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    benchmark_scaling(*(int(arg) for arg in sys.argv[1:3]))
@@ -1,27 +1,250 @@
+import io
+from dataclasses import replace
+from threading import Lock
+
 import pandas as pd
 from datetime import datetime, timedelta
 
-CSV_FILE = "data/consumption_log.csv"
+from consumption_store import COLUMNS, consumption_store
+from models.forecasting import ForecastState, method_for
+from models.parallel_forecast import forecast_items
+
+MIN_HISTORY = 3
 
 def predict_refill(item_name):
-    df = pd.read_csv(CSV_FILE, parse_dates=["date_consumed"])
-    df = df[df["item_name"] == item_name]
+    try:
+        return consumption_predictor.predict(item_name)["prediction"]
+    except ValueError as e:
+        return f"{e}."
 
-    if len(df) < 3:
-        return "Not enough data for prediction."
 
-    df["date_consumed"] = pd.to_datetime(df["date_consumed"])
-    df = df.sort_values("date_consumed")
+def load_consumption_log(csv_file=None, lookback_months=None):
+    """
+    Load the consumption log: a single CSV file if given, otherwise the
+    partitioned store's lookback window (lookback_months=0 for all of it).
+    Returns an empty frame if it can't be read.
+    """
+    try:
+        if csv_file is None:
+            return consumption_store.read(lookback_months)
+        return pd.read_csv(csv_file, parse_dates=["date_consumed"])
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return pd.DataFrame(columns=COLUMNS)
 
-    # Simple Moving Average
-    df["daily_usage"] = df["quantity_used"] / ((df["date_consumed"].diff().dt.days).fillna(1))
-    avg_daily_usage = df["daily_usage"].mean()
 
-    if avg_daily_usage <= 0:
-        return "Invalid consumption data."
+def _round_days(days):
+    return None if days is None else round(float(days), 1)
 
-    remaining_stock = df.iloc[-1]["remaining_stock"]
-    days_until_empty = remaining_stock / avg_daily_usage
+
+def prediction_result(item_name, state, forecast):
+    """The /predict response for a fitted state and its forecast"""
+    days_until_empty = float(forecast["days_until_empty"])
     refill_date = datetime.now() + timedelta(days=days_until_empty)
+    return {
+        "status": "success",
+        "item_name": item_name,
+        "prediction": f"Refill needed by {refill_date.strftime('%Y-%m-%d')}",
+        "days_until_empty": round(days_until_empty, 1),
+        "refill_date": refill_date.strftime('%Y-%m-%d'),
+        "method": state.method,
+        "daily_usage": round(float(state.level), 2),
+        "remaining_stock": state.remaining_stock,
+        "confidence_interval": {
+            "low": _round_days(forecast["low"]),
+            "high": _round_days(forecast["high"])
+        }
+    }
+
+
+class Predictor:
+    """
+    Fitted forecast state per item, kept in memory between calls.
+
+    States start from the compacted per-item summaries and replay the
+    partitions in the lookback window. refresh() compares the store's
+    signature (partition mtimes and sizes); when rows were only appended it
+    parses just the new bytes of each partition and folds them into the
+    affected items' states (O(1) per row). Anything else reloads everything.
+    Reads take no lock; if a compaction overlaps one, the load is redone
+    under the store's write lock.
+    """
+
+    # Bytes before a read offset that must be unchanged for an append-only refresh
+    GUARD_BYTES = 256
+
+    def __init__(self, store=None):
+        self.store = store or consumption_store
+        self._states = {}
+        self._rows = {}
+        self._signature = None
+        self._files = {}  # partition path -> (bytes read, guard bytes)
+        self._lock = Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    @staticmethod
+    def _complete_lines(data):
+        """Drop a partially written last line"""
+        return data[:data.rfind(b"\n") + 1]
+
+    def _load_all(self):
+        frames = []
+        self._files = {}
+        for path in self.store.partitions():
+            with open(path, "rb") as f:
+                data = self._complete_lines(f.read())
+            self._files[path] = (len(data), data[-self.GUARD_BYTES:])
+            if data:
+                frames.append(pd.read_csv(io.BytesIO(data)))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+        self._states = {}
+        self._rows = {}
+        for summary in self.store.summaries().to_dict("records"):
+            item_name = summary["item_name"]
+            self._states[item_name] = ForecastState.from_summary(summary, method_for(item_name))
+            self._rows[item_name] = int(summary["rows"])
+        # Replayed on top of the summaries; in a process pool for large logs
+        for item_name, result in forecast_items(df, initial=self._states).items():
+            self._states[item_name] = result["state"]
+            self._rows[item_name] = self._rows.get(item_name, 0) + result["rows"]
+        self.full_loads += 1
+
+    def _load_appended(self, signature):
+        """Fold rows appended since the last read into the states; False if a full load is needed"""
+        if signature[1] != self._signature[1]:
+            return False  # compaction changed the summaries
+        paths = self.store.partitions()
+        if any(path not in paths for path in self._files):
+            return False  # the window moved
+
+        frames = []
+        files = {}
+        for path in paths:
+            offset, guard = self._files.get(path, (0, b""))
+            with open(path, "rb") as f:
+                f.seek(offset - len(guard))
+                if f.read(len(guard)) != guard:
+                    return False
+                chunk = self._complete_lines(f.read())
+            files[path] = (offset + len(chunk), (guard + chunk)[-self.GUARD_BYTES:])
+            if chunk:
+                header = 0 if offset == 0 else None
+                frames.append(pd.read_csv(io.BytesIO(chunk), header=header, names=None if header == 0 else COLUMNS))
+        if not frames:
+            self._files = files
+            return True
+
+        rows = pd.concat(frames, ignore_index=True)
+        dates = pd.to_datetime(rows["date_consumed"], format="mixed", errors="coerce")
+
+        # Rows dated before an item's latest event can't be folded in incrementally
+        last_dates = {}
+        for item_name, date in zip(rows["item_name"], dates):
+            state = self._states.get(item_name)
+            previous = last_dates.get(item_name, state.last_date if state else None)
+            if previous is not None and not pd.isna(previous) and not pd.isna(date) and date < previous:
+                return False
+            last_dates[item_name] = date
+
+        for item_name, date, quantity_used, remaining_stock in zip(
+            rows["item_name"], dates, rows["quantity_used"], rows["remaining_stock"]
+        ):
+            state = self._states.get(item_name)
+            if state is None:
+                state = self._states[item_name] = ForecastState(method=method_for(item_name))
+            state.update(date, quantity_used, remaining_stock)
+            self._rows[item_name] = self._rows.get(item_name, 0) + 1
+
+        self._files = files
+        self.incremental_loads += 1
+        return True
+
+    def refresh(self):
+        """Bring the fitted states up to date with the consumption store"""
+        signature = self.store.signature()
+        with self._lock:
+            if signature == self._signature:
+                return
+            try:
+                if self._signature is None or not self._load_appended(signature):
+                    self._load_all()
+                consistent = self.store.signature()[1] == signature[1]
+            except FileNotFoundError:
+                consistent = False
+            if not consistent:
+                # A compaction ran mid-read (deleting a partition, or moving
+                # rows into the summaries); reload under the write lock
+                with self.store.write_lock():
+                    signature = self.store.signature()
+                    self._load_all()
+            self._signature = signature
+
+    def predict(self, item_name, remaining_stock=None):
+        """
+        The /predict result for item_name from the cached state, with the
+        forecast method and a confidence interval on days_until_empty; raises
+        ValueError when there is not enough or invalid data.
+
+        remaining_stock replaces the last logged stock (e.g. a live inventory
+        count); an override at zero or below means out of stock, 0 days left.
+        """
+        self.refresh()
+        with self._lock:
+            state = self._states.get(item_name)
+            if state is None or self._rows.get(item_name, 0) < MIN_HISTORY:
+                raise ValueError("Not enough data for prediction")
+            if state.count == 0:
+                raise ValueError("Invalid data: Unable to compute usage rate")
+            if remaining_stock is not None:
+                state = replace(state, remaining_stock=float(remaining_stock))
+            forecast = state.forecast()
+        if forecast is None and remaining_stock is not None and state.level > 0 and state.remaining_stock <= 0:
+            forecast = {"days_until_empty": 0.0, "low": 0.0, "high": 0.0}
+        if forecast is None:
+            raise ValueError("Invalid consumption data")
+        return prediction_result(item_name, state, forecast)
+
+    def predict_many(self, item_names=None, remaining_stock=None):
+        """
+        Predictions for several items (all known items by default), keyed by
+        name, with optional per-item remaining_stock overrides. Items that
+        can't be predicted map to {"status": "error", "detail": ...}.
+        """
+        self.refresh()
+        if item_names is None:
+            with self._lock:
+                item_names = list(self._states)
+        remaining_stock = remaining_stock or {}
+        results = {}
+        for item_name in item_names:
+            try:
+                results[item_name] = self.predict(item_name, remaining_stock.get(item_name))
+            except ValueError as e:
+                results[item_name] = {"status": "error", "item_name": item_name, "detail": str(e)}
+        return results
+
+    def low_stock(self, threshold_days=5):
+        """All items predicted to run out within threshold_days, most urgent first"""
+        items = [
+            prediction for prediction in self.predict_many().values()
+            if prediction["status"] == "success" and prediction["days_until_empty"] < threshold_days
+        ]
+        return sorted(items, key=lambda item: item["days_until_empty"])
+
+    def latest(self):
+        """item_name -> {"remaining_stock", "last_date"} for every known item, from the cached states"""
+        self.refresh()
+        with self._lock:
+            return {
+                item_name: {"remaining_stock": state.remaining_stock, "last_date": state.last_date}
+                for item_name, state in self._states.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._states), "full_loads": self.full_loads, "incremental_loads": self.incremental_loads}
+
 
-    return f"Refill needed by {refill_date.strftime('%Y-%m-%d')}"
+consumption_predictor = Predictor()
@@ -1,27 +1,115 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from typing import Optional, List
 from moya.orchestrators.base_orchestrator import BaseOrchestrator
 from moya.registry.agent_registry import AgentRegistry
 from moya.classifiers.base_classifier import BaseClassifier
-from moya.tools.ephemeral_memory import EphemeralMemory
+from conversation_memory import conversation_memory
+
+# Defaults for MultiAgentOrchestrator's config, overridable per instance
+AGENT_PARALLEL = os.environ.get("AGENT_PARALLEL", "false").lower() in ("1", "true", "yes")
+AGENT_TIMEOUT_SECONDS = float(os.environ.get("AGENT_TIMEOUT_SECONDS", "30"))
+AGENT_MAX_WORKERS = int(os.environ.get("AGENT_MAX_WORKERS", "4"))
+
+# Default routing table, in priority order: (agent name, trigger phrases)
+DEFAULT_ROUTES = [
+    ("prediction_consumption_agent", ["predict consumption"]),
+    ("predict_expiry_agent", ["predict expiry"]),
+    ("suggest_shopping_list_agent", ["shopping list"]),
+    ("suggest_similar_products_agent", ["similar products"]),
+    ("health_agent", ["health check"]),
+]
+
+
+def load_routing_table(path: str) -> list:
+    """
+    Load a routing table from a JSON file shaped like
+    [{"agent": "predict_expiry_agent", "phrases": ["predict expiry", ...]}, ...]
+    Entries are in priority order.
+    """
+    with open(path, "r") as f:
+        return [(route["agent"], route["phrases"]) for route in json.load(f)]
+
+
+def _trie_regex(phrases: List[str]) -> str:
+    """
+    Build a regex from a character trie of the phrases, so shared prefixes are
+    matched once and the pattern behaves like a single automaton over the text.
+    """
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and not terminal else "(?:" + "|".join(branches) + ")"
+        return body + "?" if terminal else body
+
+    return build(trie)
+
 
 class SimpleClassifier(BaseClassifier):
     """
     A classifier that maps API requests to appropriate agents based on keywords.
+
+    All trigger phrases are compiled into one case-insensitive pattern, the
+    message is scanned once, and every matching agent is returned in routing
+    table priority order, so multi-intent messages reach all relevant agents.
     """
 
-    def classify(self, message: str, thread_id: str, available_agents: list) -> list:
-        if "predict consumption" in message.lower():
-            return ["prediction_consumption_agent"]
-        elif "predict expiry" in message.lower():
-            return ["predict_expiry_agent"]
-        elif "shopping list" in message.lower():
-            return ["suggest_shopping_list_agent"]
-        elif "similar products" in message.lower():
-            return ["suggest_similar_products_agent"]
-        elif "health check" in message.lower():
-            return ["health_agent"]
-        else:
-            return [self.default_agent_name] if self.default_agent_name else []
+    def __init__(self, default_agent_name: Optional[str] = None, routes: Optional[list] = None):
+        """
+        :param default_agent_name: Agent used when no phrase matches.
+        :param routes: Routing table as [(agent_name, [phrases])] in priority order.
+        """
+        self.default_agent_name = default_agent_name
+        self.routes = routes if routes is not None else DEFAULT_ROUTES
+        self._priority = {}
+        self._phrase_agents = {}
+        for priority, (agent_name, phrases) in enumerate(self.routes):
+            self._priority.setdefault(agent_name, priority)
+            for phrase in phrases:
+                key = " ".join(phrase.lower().split())
+                self._phrase_agents.setdefault(key, []).append(agent_name)
+        # A match reports the longest phrase starting at a position, so fold in
+        # the agents of every shorter phrase that is a prefix of it
+        self._match_agents = {
+            key: [agent for other, agents in self._phrase_agents.items() if key.startswith(other) for agent in agents]
+            for key in self._phrase_agents
+        }
+        # Zero-width lookahead lets overlapping phrases ("shopping list" / "list items") all match
+        self._pattern = (
+            re.compile("(?=(" + _trie_regex(list(self._phrase_agents)) + "))", re.IGNORECASE)
+            if self._phrase_agents else None
+        )
+
+    @classmethod
+    def from_config(cls, path: str, default_agent_name: Optional[str] = None) -> "SimpleClassifier":
+        return cls(default_agent_name=default_agent_name, routes=load_routing_table(path))
+
+    def classify(self, message: str, thread_id: str = None, available_agents: list = None) -> list:
+        matched = set()
+        if self._pattern is not None:
+            for match in self._pattern.finditer(message):
+                matched.update(self._match_agents.get(" ".join(match.group(1).lower().split()), []))
+
+        if matched:
+            return sorted(matched, key=self._priority.__getitem__)
+        return [self.default_agent_name] if self.default_agent_name else []
 
 class MultiAgentOrchestrator(BaseOrchestrator):
     """
@@ -39,11 +127,91 @@ class MultiAgentOrchestrator(BaseOrchestrator):
         :param agent_registry: The registry to retrieve agents from.
         :param classifier: The classifier used for selecting the appropriate agent(s).
         :param default_agent_name: The fallback agent if classification fails.
-        :param config: Optional configuration dictionary.
+        :param config: Optional configuration dictionary. Supported keys:
+            parallel (bool): dispatch to all selected agents concurrently
+                (default AGENT_PARALLEL).
+            agent_timeout (float): seconds each agent gets in parallel mode,
+                counted from when it starts (default AGENT_TIMEOUT_SECONDS).
+            max_workers (int): agents run at once per message in parallel mode
+                (default AGENT_MAX_WORKERS).
         """
         super().__init__(agent_registry=agent_registry, config=config)
         self.classifier = classifier
         self.default_agent_name = default_agent_name
+        self.parallel = self.config.get("parallel", AGENT_PARALLEL)
+        self.agent_timeout = self.config.get("agent_timeout", AGENT_TIMEOUT_SECONDS)
+        self.max_workers = max(1, self.config.get("max_workers", AGENT_MAX_WORKERS))
+
+    def _start_agent(self, agent, thread_id: str, user_message: str, **kwargs) -> Future:
+        """Run one agent on its own daemon thread; the future carries its response"""
+        future = Future()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._run_agent(agent, thread_id, user_message, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name=f"agent-{agent.agent_name}", daemon=True).start()
+        return future
+
+    def _run_agent(self, agent, thread_id: str, user_message: str, stream_callback=None, cancel_event=None, **kwargs) -> str:
+        """Send the message to one agent and record the exchange in memory."""
+        conversation_memory.store_message(thread_id=thread_id, sender="user", content=user_message)
+
+        # Handle message with streaming support
+        agent_prefix = f"[{agent.agent_name}] "
+        if stream_callback:
+            stream_callback(agent_prefix)
+            response = agent_prefix
+            message_stream = agent.handle_message_stream(user_message, thread_id=thread_id, **kwargs) or []
+            for chunk in message_stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                stream_callback(chunk)
+                response += chunk
+        else:
+            response = agent_prefix + agent.handle_message(user_message, thread_id=thread_id, **kwargs)
+
+        conversation_memory.store_message(thread_id=thread_id, sender=agent.agent_name, content=response)
+        return response
+
+    def _run_agents_parallel(self, agents: list, thread_id: str, user_message: str, timeout: float, **kwargs) -> List[str]:
+        """
+        Run up to max_workers agents at once and collect responses in routing
+        order. Each agent gets the full timeout from the moment it starts, so
+        agents queued behind others aren't shortchanged. Agents that fail or
+        time out are reported inline so the caller still gets the partial
+        results from the others. A timed-out agent can't be interrupted: its
+        thread finishes in the background and the result is discarded, but
+        it no longer counts against max_workers.
+        """
+        responses: List[Optional[str]] = [None] * len(agents)
+        queued = deque(enumerate(agents))
+        running = {}  # index -> (future, deadline)
+        while queued or running:
+            while queued and len(running) < self.max_workers:
+                index, agent = queued.popleft()
+                running[index] = (self._start_agent(agent, thread_id, user_message, **kwargs), time.monotonic() + timeout)
+
+            next_deadline = min(deadline for _, deadline in running.values())
+            wait([future for future, _ in running.values()], timeout=max(0.0, next_deadline - time.monotonic()),
+                 return_when=FIRST_COMPLETED)
+
+            now = time.monotonic()
+            for index, (future, deadline) in list(running.items()):
+                agent_name = agents[index].agent_name
+                if future.done():
+                    error = future.exception()
+                    responses[index] = f"[{agent_name}] [Error: {error}]" if error is not None else future.result()
+                elif now >= deadline:
+                    responses[index] = f"[{agent_name}] [Timed out after {timeout}s]"
+                else:
+                    continue
+                del running[index]
+        return responses
 
     def orchestrate(self, thread_id: str, user_message: str, stream_callback=None, **kwargs) -> str:
         """
@@ -52,9 +220,17 @@ class MultiAgentOrchestrator(BaseOrchestrator):
         :param thread_id: Conversation thread ID.
         :param user_message: The incoming message from the user.
         :param stream_callback: Optional callback for streaming responses.
-        :param kwargs: Additional parameters.
+        :param kwargs: Additional parameters. 'parallel' and 'agent_timeout'
+            override the configured values for this call; parallel mode is
+            skipped when streaming so chunks from different agents don't interleave.
+            'cancel_event' (threading.Event) stops dispatching further agents
+            and streaming further chunks once set.
         :return: Aggregated response from selected agents.
         """
+        parallel = kwargs.pop("parallel", self.parallel)
+        agent_timeout = kwargs.pop("agent_timeout", self.agent_timeout)
+        cancel_event: Optional[threading.Event] = kwargs.pop("cancel_event", None)
+
         available_agents = self.agent_registry.list_agents()
         if not available_agents:
             return "[No agents available to handle message.]"
@@ -72,27 +248,48 @@ class MultiAgentOrchestrator(BaseOrchestrator):
         if not agent_names and self.default_agent_name:
             agent_names = [self.default_agent_name]
 
-        responses = []
-        for agent_name in agent_names:
-            agent = self.agent_registry.get_agent(agent_name)
-            if not agent:
-                continue
-
-            EphemeralMemory.store_message(thread_id=thread_id, sender="user", content=user_message)
-
-            # Handle message with streaming support
-            agent_prefix = f"[{agent.agent_name}] "
-            if stream_callback:
-                stream_callback(agent_prefix)
-                response = agent_prefix
-                message_stream = agent.handle_message_stream(user_message, thread_id=thread_id, **kwargs) or []
-                for chunk in message_stream:
-                    stream_callback(chunk)
-                    response += chunk
-            else:
-                response = agent_prefix + agent.handle_message(user_message, thread_id=thread_id, **kwargs)
-
-            EphemeralMemory.store_message(thread_id=thread_id, sender=agent.agent_name, content=response)
-            responses.append(response)
+        agents = [agent for agent in map(self.agent_registry.get_agent, agent_names) if agent]
+
+        if parallel and len(agents) > 1 and not stream_callback:
+            responses = self._run_agents_parallel(agents, thread_id, user_message, agent_timeout, **kwargs)
+        else:
+            responses = []
+            for agent in agents:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                responses.append(self._run_agent(
+                    agent, thread_id, user_message,
+                    stream_callback=stream_callback, cancel_event=cancel_event, **kwargs
+                ))
 
         return "\n".join(responses) if responses else "[No suitable agents found to handle message.]"
+
+
+def benchmark_classifier(rule_count: int = 500, message_words: int = 5000, runs: int = 20):
+    """Compare the compiled classifier with per-rule substring checks on long messages"""
+    import random
+
+    vocabulary = ["milk", "eggs", "rice", "bread", "tomato", "cheese", "apple", "onion", "flour", "butter"]
+    routes = list(DEFAULT_ROUTES) + [
+        (f"agent_{i}", [f"{random.choice(vocabulary)} rule {i}", f"keyword{i}"]) for i in range(rule_count)
+    ]
+    words = [random.choice(vocabulary) for _ in range(message_words)]
+    words[message_words // 3] = "predict expiry and build a shopping list"
+    message = " ".join(words)
+
+    def substring_classify(text: str) -> list:
+        return [agent for agent, phrases in routes if any(phrase in text.lower() for phrase in phrases)]
+
+    classifier = SimpleClassifier(routes=routes)
+    assert classifier.classify(message) == substring_classify(message)
+
+    for label, classify in (("substring chain", substring_classify), ("compiled", classifier.classify)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            classify(message)
+        elapsed = (time.perf_counter() - start) / runs
+        print(f"{label:>16}: {elapsed * 1000:.3f} ms per message ({len(routes)} rules, {len(message)} chars)")
+
+
+if __name__ == "__main__":
+    benchmark_classifier()
@@ -0,0 +1,71 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+
+RECOMMENDATION_TTL_SECONDS = float(os.environ.get("RECOMMENDATION_TTL_SECONDS", str(24 * 3600)))
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.environ.get("RECOMMENDATION_CACHE_MAX_ENTRIES", "5000"))
+
+
+class RecommendationCache:
+    """
+    TTL cache of LLM similar-product answers keyed by lowercased item name.
+    Filled by interactive requests and by the startup/scheduled warmup job.
+    Keys come from user input, so at most max_entries are kept and the least
+    recently used entry is evicted first.
+    """
+
+    def __init__(self, ttl_seconds: float = RECOMMENDATION_TTL_SECONDS, max_entries: int = RECOMMENDATION_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, item_name: str) -> Optional[List[str]]:
+        key = item_name.strip().lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def get_stale(self, item_name: str) -> Optional[List[str]]:
+        """Last known answer regardless of age, used as a degraded fallback"""
+        with self._lock:
+            entry = self._entries.get(item_name.strip().lower())
+            return entry[1] if entry else None
+
+    def contains_fresh(self, item_name: str) -> bool:
+        """Like get() but without touching the hit/miss counters"""
+        with self._lock:
+            entry = self._entries.get(item_name.strip().lower())
+            return bool(entry) and time.time() - entry[0] < self.ttl_seconds
+
+    def set(self, item_name: str, products: List[str]):
+        key = item_name.strip().lower()
+        with self._lock:
+            self._entries[key] = (time.time(), products)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,278 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Precompiled patterns used on every LLM response
+FENCED_JSON_PATTERN = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*```", re.IGNORECASE)
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+HOURS_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:h|hr|hrs|hour|hours)\b", re.IGNORECASE)
+MINUTES_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:m|min|mins|minute|minutes)\b", re.IGNORECASE)
+LIST_SPLIT_PATTERN = re.compile(r"\s*(?:\r?\n|;)\s*")
+
+MEAL_TYPES = ("breakfast", "lunch", "dinner")
+NAME_KEYS = ("name", "recipe_name", "title", "recipe", "dish")
+
+_decoder = json.JSONDecoder()
+
+
+def _loads_lenient(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", text))
+
+
+def _first_balanced_object(text: str) -> Optional[str]:
+    """
+    Return the earliest-starting balanced {...} span in one linear pass,
+    skipping braces inside strings. Unclosed braces (truncated output) are
+    ignored, so an inner complete object is still found.
+    """
+    stack = []
+    best = None
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            stack.append(index)
+        elif char == "}" and stack:
+            start = stack.pop()
+            if best is None or start < best[0]:
+                best = (start, index)
+    return text[best[0]:best[1] + 1] if best else None
+
+
+def _decode_at_braces(text: str) -> Optional[Dict[str, Any]]:
+    """First dict that raw_decode reads starting at some '{', trying each '{' left to right"""
+    position = text.find("{")
+    while position != -1:
+        try:
+            data, _ = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return data
+        position = text.find("{", position + 1)
+    return None
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """
+    Pull the JSON object out of an LLM response: the whole text, a fenced
+    ```json block, or the first balanced {...} in surrounding prose. If that
+    span isn't a JSON object (stray braces in the prose), every later '{' is
+    tried. Trailing commas are tolerated. Raises ValueError if nothing parses.
+    """
+    if not text:
+        raise ValueError("Empty AI response")
+
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            # raw_decode ignores trailing chatter after the object
+            data, _ = _decoder.raw_decode(stripped)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+
+    candidates = [match.group(1) for match in FENCED_JSON_PATTERN.finditer(text)]
+    balanced = _first_balanced_object(text)
+    if balanced:
+        candidates.append(balanced)
+
+    for candidate in candidates:
+        try:
+            data = _loads_lenient(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+
+    # Commas dropped first, or a trailing comma would make the scan settle on an inner object
+    data = _decode_at_braces(TRAILING_COMMA_PATTERN.sub(r"\1", text))
+    if data is not None:
+        return data
+
+    raise ValueError("Could not parse AI response as JSON")
+
+
+def _to_minutes(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value)
+    hours = HOURS_PATTERN.search(text)
+    minutes = MINUTES_PATTERN.search(text)
+    if hours or minutes:
+        total = (float(hours.group(1)) * 60 if hours else 0) + (float(minutes.group(1)) if minutes else 0)
+        return int(total)
+    match = NUMBER_PATTERN.search(text)
+    return int(float(match.group(0))) if match else None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = NUMBER_PATTERN.search(str(value).replace(",", ""))
+    return int(float(match.group(0))) if match else None
+
+
+def _to_string_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        items = LIST_SPLIT_PATTERN.split(value)
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = [value]
+
+    result = []
+    for item in items:
+        if isinstance(item, dict):
+            if "item_name" in item or "quantity" in item:
+                item = f"{item.get('quantity', '')} {item.get('unit', '')} {item.get('item_name', item.get('name', ''))}"
+                item = " ".join(item.split())
+            else:
+                item = item.get("step") or item.get("text") or item.get("instruction") or item.get("name") or json.dumps(item)
+        item = str(item).strip()
+        if item:
+            result.append(item)
+    return result
+
+
+def coerce_recipe_data(recipe_data: Any) -> Optional[Dict[str, Any]]:
+    """
+    Coerce one recipe from the LLM into RecipeDetails fields in a single pass.
+    Returns None if it isn't recipe-shaped (no usable name).
+    """
+    if not isinstance(recipe_data, dict):
+        return None
+
+    name = next((recipe_data[key] for key in NAME_KEYS if isinstance(recipe_data.get(key), str) and recipe_data[key].strip()), None)
+    if name is None:
+        return None
+
+    tags = recipe_data.get("dietary_tags", recipe_data.get("tags"))
+    return {
+        "name": name.strip(),
+        "ingredients": _to_string_list(recipe_data.get("ingredients")),
+        "instructions": _to_string_list(recipe_data.get("instructions", recipe_data.get("steps"))),
+        "dietary_tags": [tags] if isinstance(tags, str) else _to_string_list(tags),
+        "prep_time": _to_minutes(recipe_data.get("prep_time", recipe_data.get("preparation_time"))),
+        "calories": _to_int(recipe_data.get("calories"))
+    }
+
+
+def coerce_meal_plan_data(plan_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Coerce a parsed LLM meal plan into MealPlan fields (without date).
+    Accepts plans nested under "meal_plan" or "meals". Raises ValueError if a
+    main meal is missing.
+    """
+    for wrapper in ("meal_plan", "mealPlan", "meals", "plan"):
+        if isinstance(plan_data.get(wrapper), dict) and not all(meal in plan_data for meal in MEAL_TYPES):
+            nested = plan_data[wrapper]
+            plan_data = dict(nested, suggested_recipes=nested.get("suggested_recipes", plan_data.get("suggested_recipes")))
+            break
+
+    coerced = {}
+    for meal_type in MEAL_TYPES:
+        recipe = coerce_recipe_data(plan_data.get(meal_type) or plan_data.get(meal_type.capitalize()))
+        if recipe is None:
+            raise ValueError(f"AI response is missing a valid {meal_type} recipe")
+        coerced[meal_type] = recipe
+
+    suggestions = plan_data.get("suggested_recipes", plan_data.get("alternative_recipes")) or []
+    if isinstance(suggestions, dict):
+        suggestions = [suggestions]
+    coerced["suggested_recipes"] = [
+        recipe for recipe in map(coerce_recipe_data, suggestions) if recipe is not None
+    ] if isinstance(suggestions, list) else []
+    return coerced
+
+
+def parse_meal_plan_response(response: str) -> Dict[str, Any]:
+    """Extract and coerce a meal plan from raw LLM output"""
+    return coerce_meal_plan_data(extract_json_object(response))
+
+
+def _build_corpus(meal_plans_file: str = "data/meal_plans.json") -> List[str]:
+    """LLM-style renderings of stored meal plans: raw, fenced, prose-wrapped, sloppy"""
+    with open(meal_plans_file, "r") as f:
+        plans = json.load(f)
+
+    corpus = []
+    for plan in plans:
+        body = {key: plan[key] for key in ("breakfast", "lunch", "dinner", "suggested_recipes") if key in plan}
+        raw = json.dumps(body, indent=2)
+        sloppy = dict(body, breakfast=dict(body["breakfast"], prep_time=f"{body['breakfast'].get('prep_time') or 10} minutes"))
+        sloppy["lunch"] = {("recipe_name" if k == "name" else k): v for k, v in body["lunch"].items()}
+        corpus.extend([
+            raw,
+            f"```json\n{raw}\n```",
+            f"Here is your meal plan:\n\n{raw}\n\nEnjoy your meals!",
+            json.dumps({"meal_plan": sloppy}).replace("]", ",]", 1),
+        ])
+    return corpus
+
+
+def benchmark_parsing(runs: int = 200):
+    """Time the parser against the stored-plan corpus"""
+    import time
+
+    corpus = _build_corpus()
+    start = time.perf_counter()
+    for _ in range(runs):
+        for text in corpus:
+            parse_meal_plan_response(text)
+    elapsed = time.perf_counter() - start
+    print(f"parsed {runs * len(corpus)} responses, {elapsed / (runs * len(corpus)) * 1e6:.1f} us per response")
+
+
+def fuzz_parsing(iterations: int = 5000, seed: int = 0):
+    """Mutate corpus responses and check the parser only ever raises ValueError"""
+    import random
+
+    rng = random.Random(seed)
+    corpus = _build_corpus()
+    alphabet = '{}[]",:\\ \nabc123'
+    parsed = 0
+    for _ in range(iterations):
+        text = list(rng.choice(corpus))
+        for _ in range(rng.randint(1, 8)):
+            position = rng.randrange(len(text) + 1)
+            action = rng.random()
+            if action < 0.4 and text:
+                del text[min(position, len(text) - 1)]
+            elif action < 0.8:
+                text.insert(position, rng.choice(alphabet))
+            else:
+                text = text[:position]
+        try:
+            parse_meal_plan_response("".join(text))
+            parsed += 1
+        except ValueError:
+            pass
+    print(f"fuzz: {iterations} mutated responses, {parsed} still parsed, no unexpected errors")
+
+
+if __name__ == "__main__":
+    for text in _build_corpus():
+        parse_meal_plan_response(text)
+    benchmark_parsing()
+    fuzz_parsing()
@@ -0,0 +1,143 @@
+from typing import Any, Dict, List
+
+from ingredient_matching import InventoryMatcher
+
+
+def assemble_shopping_list(
+    shopping_list: List[Dict[str, Any]],
+    recommendation_results: Dict[str, List[str]],
+    inventory_dict: Dict[str, Dict[str, Any]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Attach similar-product recommendations to shopping list items, add
+    complementary suggestions that are neither listed nor in inventory, and
+    split the list into categories. Every step is a keyed lookup, so the
+    whole assembly is linear in the list size.
+
+    recommendation_results and inventory_dict are keyed by lowercased item
+    name. Items appear in both urgent_items and meal_plan_items when they
+    qualify for both; other_items holds everything else.
+    """
+    # Exact key first, then a token-index match for names like "Basmati Rice" vs "rice"
+    recommendation_matcher = None
+    for item in shopping_list:
+        item_key = item["item_name"].lower()
+        if item_key in recommendation_results:
+            item["suggested_similar_items"] = recommendation_results[item_key]
+            continue
+        if recommendation_matcher is None:
+            recommendation_matcher = InventoryMatcher(recommendation_results)
+        rec_key = recommendation_matcher.lookup(item_key)
+        if rec_key is not None:
+            item["suggested_similar_items"] = recommendation_results[rec_key]
+
+    # Add related items from the recommendations that are missing from the list and inventory
+    listed = {item["item_name"].lower() for item in shopping_list}
+    related_items = {}
+    for item in shopping_list:
+        for similar_item in item["suggested_similar_items"]:
+            related_items.setdefault(similar_item.lower(), None)
+
+    for related_item in related_items:
+        if related_item in listed or related_item in inventory_dict:
+            continue
+        listed.add(related_item)
+        shopping_list.append({
+            "item_name": related_item.title(),
+            "refill_by": None,
+            "remaining_stock": None,
+            "daily_usage": None,
+            "days_left": None,
+            "suggested_similar_items": [],
+            "source": "complementary_suggestion"
+        })
+
+    # Categorize items in one pass
+    categories = {"urgent_items": [], "meal_plan_items": [], "other_items": [], "complementary_suggestions": []}
+    for item in shopping_list:
+        days_left = item.get("days_left", 0)
+        urgent = days_left is not None and days_left <= 2
+        source = item.get("source")
+        if urgent:
+            categories["urgent_items"].append(item)
+        if source == "meal_plan_requirement":
+            categories["meal_plan_items"].append(item)
+        if source == "complementary_suggestion":
+            categories["complementary_suggestions"].append(item)
+        if not urgent and source not in ("meal_plan_requirement", "complementary_suggestion"):
+            categories["other_items"].append(item)
+    return categories
+
+
+def _assemble_quadratic(shopping_list, recommendation_results, inventory):
+    """The previous list-scanning assembly, kept for the benchmark"""
+    for item in shopping_list:
+        item_key = item["item_name"].lower()
+        if item_key in recommendation_results:
+            item["suggested_similar_items"] = recommendation_results[item_key]
+        else:
+            for rec_key in recommendation_results:
+                if rec_key in item_key or item_key in rec_key:
+                    item["suggested_similar_items"] = recommendation_results[rec_key]
+                    break
+    related_items = set()
+    for item in shopping_list:
+        for similar_item in item["suggested_similar_items"]:
+            related_items.add(similar_item.lower())
+    for related_item in related_items:
+        if any(item["item_name"].lower() == related_item for item in shopping_list):
+            continue
+        if not any(inv_item["item_name"].lower() == related_item for inv_item in inventory):
+            shopping_list.append({"item_name": related_item.title(), "days_left": None, "suggested_similar_items": [],
+                                  "source": "complementary_suggestion"})
+    urgent_items = [item for item in shopping_list if item.get("days_left", 0) is not None and item.get("days_left", 0) <= 2]
+    meal_plan_items = [item for item in shopping_list if item.get("source") == "meal_plan_requirement"]
+    complementary_items = [item for item in shopping_list if item.get("source") == "complementary_suggestion"]
+    other_items = [item for item in shopping_list if item not in urgent_items and item not in meal_plan_items and item not in complementary_items]
+    return {"urgent_items": urgent_items, "meal_plan_items": meal_plan_items,
+            "other_items": other_items, "complementary_suggestions": complementary_items}
+
+
+def benchmark_assembly(list_size: int = 2000, runs: int = 3):
+    """Compare linear assembly with the previous list-scanning version on a 2k-item list"""
+    import random
+    import time
+
+    rng = random.Random(0)
+
+    def build():
+        shopping_list = [{
+            "item_name": f"Item {i}",
+            "days_left": rng.choice([0, 1, 3, 5]),
+            "suggested_similar_items": [],
+            "source": rng.choice(["consumption_prediction", "meal_plan_requirement"])
+        } for i in range(list_size)]
+        recommendation_results = {f"item {i}": [f"related {rng.randrange(list_size)}", f"item {rng.randrange(list_size)}"]
+                                  for i in range(0, list_size, 2)}
+        inventory = [{"item_name": f"Related {i}"} for i in range(0, list_size, 3)]
+        return shopping_list, recommendation_results, inventory
+
+    rng.seed(0)
+    old_time = 0.0
+    for _ in range(runs):
+        shopping_list, recommendation_results, inventory = build()
+        start = time.perf_counter()
+        old = _assemble_quadratic(shopping_list, recommendation_results, inventory)
+        old_time += time.perf_counter() - start
+
+    rng.seed(0)
+    new_time = 0.0
+    for _ in range(runs):
+        shopping_list, recommendation_results, inventory = build()
+        start = time.perf_counter()
+        new = assemble_shopping_list(shopping_list, recommendation_results,
+                                     {item["item_name"].lower(): item for item in inventory})
+        new_time += time.perf_counter() - start
+
+    sizes = lambda result: {name: len(items) for name, items in result.items()}
+    print(f"list scanning: {old_time / runs * 1000:.1f} ms {sizes(old)}")
+    print(f"keyed lookups: {new_time / runs * 1000:.1f} ms {sizes(new)}")
+
+
+if __name__ == "__main__":
+    benchmark_assembly()